@@ -0,0 +1,107 @@
+import os
+import socket
+import threading
+from pathlib import Path
+from typing import Iterator
+
+import zstandard
+
+from config import get_logger, ARCHIVE_SEGMENT_SIZE, ARCHIVE_LEVEL
+
+logger = get_logger(__name__)
+
+
+# every response is an independent zstd frame appended to a segment file, so a record is
+# decompressed on its own from the offset in the index; the segment itself is a valid zstd stream
+
+class Archive:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        # several processes may share the directory, so segments are named after their writer
+        self.prefix = f'{socket.gethostname()}-{os.getpid()}'
+        self.number = 0
+        self.segment = None
+        self.index = None
+
+        # compressors aren't thread safe, so every fetch worker gets its own
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @property
+    def compressor(self) -> zstandard.ZstdCompressor:
+        if not hasattr(self.local, 'compressor'):
+            self.local.compressor = zstandard.ZstdCompressor(level=ARCHIVE_LEVEL)
+
+        return self.local.compressor
+
+    def _rotate(self):
+        self.close()
+
+        # a restarted writer never appends to a segment that could be cut off
+        while (self.path / f'{self.prefix}-{self.number:06d}.zst').exists():
+            self.number += 1
+
+        name = f'{self.prefix}-{self.number:06d}'
+        self.segment = open(self.path / f'{name}.zst', 'ab')
+        self.index = open(self.path / f'{name}.idx', 'a', encoding='utf-8')
+        logger.info(f'archive segment {name} is opened')
+
+    def write(self, match_id: str, kind: str, data: str):
+        frame = self.compressor.compress(data.encode('utf-8'))
+
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= ARCHIVE_SEGMENT_SIZE:
+                self._rotate()
+
+            offset = self.segment.tell()
+            self.segment.write(frame)
+            self.segment.flush()
+
+            # the index line goes after the frame, so an indexed record is always complete
+            self.index.write(f'{match_id}\t{kind}\t{offset}\t{len(frame)}\n')
+            self.index.flush()
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment = self.index = None
+
+
+class ArchiveReader:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def segments(self) -> list[Path]:
+        return sorted(self.path.glob('*.idx'))
+
+    def index(self, segment: Path) -> Iterator[tuple[str, str, int, int]]:
+        with open(segment, encoding='utf-8') as file:
+            for line in file:
+                match_id, kind, offset, size = line.rstrip('\n').split('\t')
+                yield match_id, kind, int(offset), int(size)
+
+    def lookup(self) -> dict[tuple[str, str], tuple[Path, int, int]]:
+        return {
+            (match_id, kind): (segment.with_suffix('.zst'), offset, size)
+            for segment in self.segments()
+            for match_id, kind, offset, size in self.index(segment)
+        }
+
+    def read(self, segment: Path, offset: int, size: int) -> str:
+        with open(segment, 'rb') as file:
+            file.seek(offset)
+            return self.decompressor.decompress(file.read(size)).decode('utf-8')
+
+    def records(self, segment: Path) -> Iterator[tuple[str, str, str]]:
+        with open(segment.with_suffix('.zst'), 'rb') as file:
+            for match_id, kind, offset, size in self.index(segment):
+                file.seek(offset)
+                yield match_id, kind, self.decompressor.decompress(file.read(size)).decode('utf-8')
+
+    def __iter__(self) -> Iterator[tuple[str, str, str]]:
+        for segment in self.segments():
+            yield from self.records(segment)
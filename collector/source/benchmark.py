@@ -0,0 +1,61 @@
+import argparse
+import time
+from pathlib import Path
+from typing import Iterator
+
+from archive import ArchiveReader
+from handlers import PARSERS
+
+
+# compares the parser engines on archived payloads, run it on a sample of real responses
+# before switching PARSER of a deployment
+
+def get_payloads(path: Path) -> Iterator[tuple[str, str, str]]:
+    if any(path.glob('*.idx')):
+        yield from ArchiveReader(path)
+    else:
+        for file in sorted(path.rglob('*.json')):
+            match_id, kind = file.name.removesuffix('.json').rsplit('.', 1)
+            yield match_id, kind, file.read_text(encoding='utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the parser engines on archived responses')
+    parser.add_argument('path', type=Path, help='archive directory or directory of json files')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    payloads: dict[str, list[tuple[str, str]]] = {}
+    for match_id, kind, data in get_payloads(args.path):
+        if kind in PARSERS['pydantic'] and len(payloads.setdefault(kind, [])) != args.limit:
+            payloads[kind].append((match_id, data))
+
+    for kind, items in payloads.items():
+        size = sum(len(data) for _, data in items) / 1024 / 1024
+        print(f'{kind}: {len(items)} payloads, {size:.1f} MiB')
+
+        # every engine has to give the same data as the reference one
+        reference = [PARSERS['pydantic'][kind](data).model_dump() for _, data in items]
+        for engine, parsers in PARSERS.items():
+            mismatches = [
+                match_id for (match_id, data), expected in zip(items, reference)
+                if parsers[kind](data).model_dump() != expected
+            ]
+
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                for _, data in items:
+                    parsers[kind](data)
+                timings.append(time.perf_counter() - started)
+
+            best = min(timings)
+            print(
+                f'  {engine:>8}: {best / len(items) * 1000:8.2f} ms per payload, {size / best:7.1f} MiB/s, '
+                f'{len(mismatches)} mismatches{f' ({', '.join(mismatches[:5])})' if mismatches else ''}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import threading
+
+# ids of one chunk, 128 KiB of bits
+CHUNK_BITS = 1 << 20
+
+
+class Bitmap:
+    # a set of non-negative ints as bits in chunks that are allocated when an id of their range is added,
+    # game ids of a platform are dense within a few hundred million, so that's a few MB instead of a set
+    def __init__(self):
+        self.chunks: dict[int, bytearray] = {}
+        self.size = 0
+        # reads are lock-free, only the read-modify-write of a byte needs it
+        self.lock = threading.Lock()
+
+    def add(self, value: int):
+        chunk, bit = divmod(value, CHUNK_BITS)
+        byte, mask = bit >> 3, 1 << (bit & 7)
+
+        with self.lock:
+            if chunk not in self.chunks:
+                self.chunks[chunk] = bytearray(CHUNK_BITS >> 3)
+
+            if not self.chunks[chunk][byte] & mask:
+                self.chunks[chunk][byte] |= mask
+                self.size += 1
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: int) -> bool:
+        chunk, bit = divmod(value, CHUNK_BITS)
+        bits = self.chunks.get(chunk)
+
+        return bits is not None and bool(bits[bit >> 3] & (1 << (bit & 7)))
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.chunks) * (CHUNK_BITS >> 3)
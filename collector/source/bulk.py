@@ -0,0 +1,158 @@
+import threading
+from collections import deque
+from datetime import datetime, UTC
+from enum import Enum as PythonEnum
+from functools import cache
+from typing import Any, Callable, Iterable
+
+from psycopg import Cursor
+from psycopg.types.json import Jsonb
+from sqlalchemy import inspect, ARRAY, BigInteger, Boolean, DateTime, Enum, Float, Integer, Table
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import RelationshipDirection
+from sqlmodel import SQLModel
+
+
+def to_naive(value: datetime | None) -> datetime | None:
+    # the columns are timestamp without time zone and the timestamps of riot are utc
+    return value.astimezone(UTC).replace(tzinfo=None) if value is not None and value.tzinfo is not None else value
+
+
+def to_name(value: PythonEnum | None) -> str | None:
+    # sqlalchemy stores enum members by name, and the binary form of an enum is its label as text
+    return value.name if value is not None else None
+
+
+def to_jsonb(value: Any) -> Jsonb | None:
+    return Jsonb(value) if value is not None else None
+
+
+def get_type(column_type: Any) -> tuple[str, Callable[[Any], Any] | None]:
+    if isinstance(column_type, JSONB):
+        return 'jsonb', to_jsonb
+    if isinstance(column_type, ARRAY):
+        return f'{get_type(column_type.item_type)[0]}[]', None
+    if isinstance(column_type, Enum):
+        return 'text', to_name
+    if isinstance(column_type, BigInteger):
+        return 'int8', None
+    if isinstance(column_type, Integer):
+        return 'int4', None
+    if isinstance(column_type, Boolean):
+        return 'bool', None
+    if isinstance(column_type, Float):
+        return 'float8', None
+    if isinstance(column_type, DateTime):
+        return 'timestamp', to_naive
+
+    return 'text', None
+
+
+@cache
+def get_relationships(model: type[SQLModel]) -> dict[str, tuple[str, str]]:
+    # a foreign key column to its many-to-one relationship and the column of the related row it's taken from
+    relationships = {}
+    for relationship in inspect(model).relationships:
+        if relationship.direction is RelationshipDirection.MANYTOONE:
+            for local, remote in relationship.local_remote_pairs:
+                relationships[local.name] = relationship.key, remote.name
+
+    return relationships
+
+
+def get_value(obj: SQLModel, name: str) -> Any:
+    # the related row can have the value from a relationship of its own too, like the match of an event
+    values = obj.__dict__
+    relationship = get_relationships(type(obj)).get(name)
+    if relationship is not None and relationship[0] in values:
+        related = values[relationship[0]]
+        return get_value(related, relationship[1]) if related is not None else None
+
+    # rows from a closed session are expired, their key is still known to their state
+    value = values.get(name)
+    if value is None and (state := inspect(obj)).identity is not None:
+        keys = [column.name for column in state.mapper.primary_key]
+        if name in keys:
+            value = state.identity[keys.index(name)]
+
+    return value
+
+
+class Copy:
+    # writes rows of a table with binary COPY straight from the __dict__ of row objects that were
+    # never added to a session; a foreign key is taken from its many-to-one relationship when it's
+    # set, as the unit of work would do, so the objects can be built the same way as for the orm;
+    # with a table, the objects of the model are written into its columns, which the model has too
+    def __init__(self, model: type[SQLModel], table: Table | None = None):
+        self.table = table if table is not None else model.__table__
+        # columns filled by the server are left to it
+        columns = [column for column in self.table.columns if column.server_default is None]
+        self.columns = [column.name for column in columns]
+
+        types = [get_type(column.type) for column in columns]
+        self.types = [name for name, _ in types]
+        self.converters = [(number, converter) for number, (_, converter) in enumerate(types) if converter]
+
+        self.relationships = get_relationships(model)
+
+        self.statement = (
+            f'COPY {self.table.name} ({', '.join(f'"{column}"' for column in self.columns)}) FROM STDIN (FORMAT BINARY)'
+        )
+
+    def row(self, obj: SQLModel) -> list[Any]:
+        values = obj.__dict__
+        row = []
+        for column in self.columns:
+            relationship = self.relationships.get(column)
+            if relationship is not None and relationship[0] in values:
+                related = values[relationship[0]]
+                row.append(get_value(related, relationship[1]) if related is not None else None)
+            else:
+                row.append(values.get(column))
+
+        for number, converter in self.converters:
+            row[number] = converter(row[number])
+
+        return row
+
+    def write(self, cursor: Cursor, rows: Iterable[list[Any]]):
+        with cursor.copy(self.statement) as copy:
+            copy.set_types(self.types)
+            for row in rows:
+                copy.write_row(row)
+
+    def write_objects(self, cursor: Cursor, objects: list[SQLModel]):
+        if objects:
+            self.write(cursor, (self.row(obj) for obj in objects))
+
+    def write_values(self, cursor: Cursor, values: list[dict[str, Any]]):
+        if values:
+            self.write(cursor, ([value.get(column) for column in self.columns] for value in values))
+
+
+class Keys:
+    # primary keys are assigned on the client from blocks reserved from the sequences, so a whole graph
+    # can be written without reading keys back and children can reference their parent before it's written
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self.blocks: dict[str, deque[int]] = {}
+        self.lock = threading.Lock()
+
+    def assign(self, cursor: Cursor, model: type[SQLModel], objects: list[SQLModel], block_size: int | None = None):
+        # keys of a write that was rolled back are kept, they were never committed
+        objects = [obj for obj in objects if obj.__dict__.get('id') is None]
+        if not objects:
+            return
+
+        with self.lock:
+            block = self.blocks.setdefault(model.__tablename__, deque())
+            if len(block) < len(objects):
+                # sequences aren't transactional, the keys of a block are never handed out twice
+                cursor.execute(
+                    'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                    (model.__tablename__, 'id', max(block_size or self.block_size, len(objects) - len(block)))
+                )
+                block.extend(key for key, in cursor.fetchall())
+
+            for obj in objects:
+                obj.__dict__['id'] = block.popleft()
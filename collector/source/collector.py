@@ -1,59 +1,129 @@
-import sys
+import os
+import socket
+import threading
+import time
 import traceback
-
-from requests import ConnectionError
-from riotwatcher import LolWatcher, ApiError
-
-from config import get_logger, NOT_FOUNDED_EXIT, NOT_FOUNDED_ERROR, NOT_FOUNDED_WARNING, ERROR_COUNT_EXCEEDED
+from typing import Iterator
+
+from requests import ConnectionError, Timeout
+from riotwatcher import LolWatcher, ApiError, RateLimiter
+
+from archive import Archive
+from config import (
+    get_logger,
+    NAME,
+    NOT_FOUNDED_PROBE,
+    PROBE_BUDGET,
+    PROBE_WIDTH,
+    QUEUE_ALLOWLIST,
+    QUEUE_DENYLIST,
+    GAME_MODE_ALLOWLIST,
+    GAME_MODE_DENYLIST,
+    GAME_TYPE_ALLOWLIST,
+    GAME_TYPE_DENYLIST,
+    KEEP_FILTERED_MATCHES,
+    EVENT_TYPE_DENYLIST,
+    PARTICIPANT_FRAME_STEP,
+    PARTICIPANT_FRAMES,
+    CHALLENGES,
+    ERROR_COUNT_EXCEEDED,
+    IN_FLIGHT,
+    FETCH_WORKERS,
+    TRANSFORM_WORKERS,
+    WRITE_WORKERS,
+    WRITE_BATCH_SIZE,
+    WRITE_BATCH_LATENCY,
+    QUEUE_SIZE,
+    HTTP_TIMEOUT,
+    LEASE_HEARTBEAT,
+    FRONTIER_BACKOFF,
+    RESUME_FROM,
+    CHECKPOINT_INTERVAL,
+    RETRY_BACKOFF,
+    RATE_LIMITED_RETRIES
+)
 from db import (
     DB,
+    Lease,
     Match,
     Participant,
-    Challenge,
     ChallengeParticipantLink,
-    Missions,
     Perk,
     Team,
-    Ban,
     ParticipantFrame,
+    ParticipantTimeline,
+    TIMELINE_STATS,
     Frame,
     Event,
     VictimDamageDealt,
     VictimDamageReceived
 )
 from enums import Region
-from handlers import PydanticDeserializer
+import mappers
+from handlers import MatchDeserializer, RateLimitScheduler, configure_transport
 from models import MatchDto, TimelineDto, FramesTimeLineDto, ParticipantDto
+from pipeline import Job, Pipeline
+from timeline import TimelineStream
 
 logger = get_logger(__name__)
 
 
+class CollectorExit(Exception):
+    # a region can't go on, main stops the other ones and exits with an error
+    pass
+
+
 class Collector:
-    def __init__(self, db: DB, *, api_key: str, region: Region):
+    def __init__(
+            self,
+            db: DB,
+            *,
+            api_key: str,
+            region: Region,
+            rate_limiter: RateLimiter | None = None,
+            archive: Archive | None = None,
+            stop: threading.Event | None = None
+    ):
         self.db = db
+        # shared by the regions of a process, set when one of them exits
+        self.stop = stop or threading.Event()
 
         self.region = region
-        self.api = LolWatcher(api_key, deserializer=PydanticDeserializer())
+        self.api = LolWatcher(
+            api_key,
+            timeout=HTTP_TIMEOUT,
+            rate_limiter=rate_limiter or RateLimitScheduler(),
+            deserializer=MatchDeserializer(archive)
+        )
+        configure_transport(self.api)
 
         self.index = -1
         self.last_founded = self.index
         self.error_counter = 0
+        self.last_error: Exception | None = None
+        # the first id found by probing past the end of the leased range of the last run
+        self.found_past_end: int | None = None
+        # matches found by the last probe by id, the fetch of the one the walk goes on from reuses it
+        self.probed: dict[int, MatchDto] = {}
 
     # noinspection PyPep8Naming
     @property
     def matchId(self) -> str:
-        return f'{self.region}_{self.index}'
+        return self.match_id(self.index)
 
-    def get(self, method, *args, retry: int = 0, error: Exception = None, **kwargs) -> MatchDto | TimelineDto | None:
+    def match_id(self, index: int) -> str:
+        return f'{self.region.platform}_{index}'
+
+    @staticmethod
+    def get(
+            method, *args, retry: int = 0, rate_limited: int = 0, error: Exception = None, **kwargs
+    ) -> MatchDto | TimelineDto | None:
         if retry > 2:
             logger.error('All retries are exceeded')
             raise error
 
         try:
-            result = method(*args, **kwargs)
-
-            self.last_founded = self.index
-            return result
+            return method(*args, **kwargs)
 
         except ApiError as err:
             if err.response.status_code == 404:
@@ -65,46 +135,68 @@ class Collector:
                     f') doesn\'t found entity'
                 )
 
-                if self.index - self.last_founded > NOT_FOUNDED_EXIT:
-                    logger.critical(
-                        f'NOT_FOUNDED_EXIT reached: last_founded = {self.last_founded}, index = {self.index}'
-                    )
-                    sys.exit()
+            elif err.response.status_code == 429:
+                # the rate limiter already waits for Retry-After, so it doesn't burn a retry,
+                # but a limit that never clears is given up on instead of recursing without end
+                if rate_limited >= RATE_LIMITED_RETRIES:
+                    logger.error('All rate limited retries are exceeded')
+                    raise
 
-                elif self.index - self.last_founded > NOT_FOUNDED_ERROR:
-                    logger.error(
-                        f'NOT_FOUNDED_ERROR reached: last_founded = {self.last_founded}, index = {self.index}'
-                    )
-
-                elif self.index - self.last_founded > NOT_FOUNDED_WARNING:
-                    logger.warning(
-                        f'NOT_FOUNDED_WARNING reached: last_founded = {self.last_founded}, index = {self.index}'
-                    )
+                return Collector.get(
+                    method, *args, retry=retry, rate_limited=rate_limited + 1, error=err, **kwargs
+                )
 
             else:
                 logger.warning(f'HTTPError occurred while {retry} retry')
-                return self.get(method, *args, retry=retry + 1, error=err, **kwargs)
+                time.sleep(RETRY_BACKOFF * 2 ** retry)
+                return Collector.get(
+                    method, *args, retry=retry + 1, rate_limited=rate_limited, error=err, **kwargs
+                )
 
-        except ConnectionError as err:
-            logger.warning(f'ConnectionError occurred while {retry} retry')
-            return self.get(method, *args, retry=retry + 1, error=err, **kwargs)
+        except (ConnectionError, Timeout) as err:
+            logger.warning(f'{type(err).__name__} occurred while {retry} retry')
+            time.sleep(RETRY_BACKOFF * 2 ** retry)
+            return Collector.get(method, *args, retry=retry + 1, rate_limited=rate_limited, error=err, **kwargs)
 
-    def get_match_and_timeline(self) -> tuple[None, None] | tuple[MatchDto, None] | tuple[MatchDto, TimelineDto]:
+    @staticmethod
+    def is_wanted(match: MatchDto) -> bool:
+        for value, allowlist, denylist in (
+                (match.info.queueId, QUEUE_ALLOWLIST, QUEUE_DENYLIST),
+                (match.info.gameMode, GAME_MODE_ALLOWLIST, GAME_MODE_DENYLIST),
+                (match.info.gameType, GAME_TYPE_ALLOWLIST, GAME_TYPE_DENYLIST)
+        ):
+            if (allowlist and value not in allowlist) or value in denylist:
+                return False
+
+        return True
+
+    def get_match_and_timeline(
+            self, index: int, match: MatchDto | None = None
+    ) -> tuple[None, None] | tuple[MatchDto, None] | tuple[MatchDto, TimelineDto]:
         params = {
             'region': self.region.platform,
-            'match_id': self.matchId
+            'match_id': self.match_id(index)
         }
 
-        match: MatchDto = self.get(self.api.match.by_id, **params)
+        if match is None:
+            match = self.get(self.api.match.by_id, **params)
         if not match:
             return None, None
 
+        # the timeline is the expensive half of a match, so it isn't requested for unwanted ones
+        if not self.is_wanted(match):
+            logger.info(
+                f'match with id = {self.match_id(index)} is filtered: queueId = {match.info.queueId}, '
+                f'gameMode = {match.info.gameMode}, gameType = {match.info.gameType}'
+            )
+            return match, None
+
         timeline: TimelineDto = self.get(self.api.match.timeline_by_match, **params)
         if not timeline:
-            logger.error(f'timeline is None but match isn\'t with id = f{self.index}')
+            logger.error(f'timeline is None but match isn\'t with id = {self.match_id(index)}')
             return match, None
 
-        logger.info(f'match and timeline with id = {self.index} are retrieved')
+        logger.info(f'match and timeline with id = {self.match_id(index)} are retrieved')
         return match, timeline
 
     @staticmethod
@@ -112,33 +204,33 @@ class Collector:
         perks_db = []
         for perk in participant.perks.styles:
             for selection in perk.selections:
-                perk_db = Perk.model_validate(selection.model_dump())
-                perk_db.description = perk.description
-                perk_db.style = perk.style
-
-                perks_db.append(perk_db)
+                perks_db.append(mappers.perk(selection, description=perk.description, style=perk.style))
 
         return perks_db
 
-    def _get_participants(self, match: MatchDto, challenges_table: dict[str, Challenge]) -> list[Participant]:
+    def _get_participants(self, match: MatchDto, challenges_table: dict[str, int] | None) -> list[Participant]:
         participants: list[Participant] = []
         for participant in match.info.participants:
 
-            participant_db = Participant.model_validate(participant.model_dump())
-            participant_db.defenseStat = participant.perks.statPerks.defense
-            participant_db.flexStat = participant.perks.statPerks.flex
-            participant_db.offenseStat = participant.perks.statPerks.offense
+            participant_db = mappers.participant(
+                participant,
+                defenseStat=participant.perks.statPerks.defense,
+                flexStat=participant.perks.statPerks.flex,
+                offenseStat=participant.perks.statPerks.offense
+            )
 
             participant_db.perks = self._get_perks(participant)
 
             if participant.missions:
-                participant_db.missions = Missions.model_validate(participant.missions.model_dump())
+                participant_db.missions = mappers.missions(participant.missions)
 
-            if participant.challenges:
+            if participant.challenges and CHALLENGES == 'rows':
+                participant_db.challenges = None
                 for challenge_name, challenge_value in participant.challenges.items():
                     ChallengeParticipantLink(
-                        value=challenge_value,
-                        challenge=challenges_table[challenge_name],
+                        value=repr(challenge_value),
+                        # by id, the same challenge is shared by the matches of a batch
+                        challenge_id=challenges_table[challenge_name],
                         participant=participant_db
                     )
 
@@ -150,25 +242,26 @@ class Collector:
     def _get_teams(match: MatchDto, participants: list[Participant]) -> list[Team]:
         teams: list[Team] = []
         for team in match.info.teams:
-            team_db = Team.model_validate(team.model_dump())
-
-            team_db.baronFirst = team.objectives.baron.first
-            team_db.baronKills = team.objectives.baron.kills
-            team_db.championFirst = team.objectives.champion.first
-            team_db.championKills = team.objectives.champion.kills
-            team_db.dragonFirst = team.objectives.dragon.first
-            team_db.dragonKills = team.objectives.dragon.kills
+            team_db = mappers.team(
+                team,
+                baronFirst=team.objectives.baron.first,
+                baronKills=team.objectives.baron.kills,
+                championFirst=team.objectives.champion.first,
+                championKills=team.objectives.champion.kills,
+                dragonFirst=team.objectives.dragon.first,
+                dragonKills=team.objectives.dragon.kills,
+                inhibitorFirst=team.objectives.inhibitor.first,
+                inhibitorKills=team.objectives.inhibitor.kills,
+                riftHeraldFirst=team.objectives.riftHerald.first,
+                riftHeraldKills=team.objectives.riftHerald.kills,
+                towerFirst=team.objectives.tower.first,
+                towerKills=team.objectives.tower.kills
+            )
             if team.objectives.horde is not None:
                 team_db.hordeFirst = team.objectives.horde.first
                 team_db.hordeKills = team.objectives.horde.kills
-            team_db.inhibitorFirst = team.objectives.inhibitor.first
-            team_db.inhibitorKills = team.objectives.inhibitor.kills
-            team_db.riftHeraldFirst = team.objectives.riftHerald.first
-            team_db.riftHeraldKills = team.objectives.riftHerald.kills
-            team_db.towerFirst = team.objectives.tower.first
-            team_db.towerKills = team.objectives.tower.kills
-
-            team_db.bans = [Ban.model_validate(ban.model_dump()) for ban in team.bans]
+
+            team_db.bans = [mappers.ban(ban) for ban in team.bans]
             team_db.participants = [participant for participant in participants if participant.teamId == team.teamId]
 
             teams.append(team_db)
@@ -181,9 +274,7 @@ class Collector:
     ) -> list[VictimDamageDealt]:
         victim_damages_dealt_db = []
         for victim_damage_dealt in event.victimDamageDealt:
-            victim_damage_dealt_db = VictimDamageDealt.model_validate(
-                victim_damage_dealt.model_dump()
-            )
+            victim_damage_dealt_db = mappers.victim_damage_dealt(victim_damage_dealt)
             victim_damage_dealt_db.participant = participant_id_to_participant[
                 victim_damage_dealt.participantId
             ] if victim_damage_dealt.participantId != 0 else None
@@ -198,10 +289,7 @@ class Collector:
     ) -> list[VictimDamageReceived]:
         victim_damages_received_db = []
         for victim_damage_received in event.victimDamageReceived:
-            victim_damage_received_db = VictimDamageReceived.model_validate(
-                victim_damage_received.model_dump()
-            )
-
+            victim_damage_received_db = mappers.victim_damage_received(victim_damage_received)
             victim_damage_received_db.participant = participant_id_to_participant[
                 victim_damage_received.participantId
             ] if victim_damage_received.participantId != 0 else None
@@ -219,7 +307,10 @@ class Collector:
     ) -> list[Event]:
         events_db = []
         for event in frame.events:
-            event_db = Event.model_validate(event.model_dump())
+            if event.type in EVENT_TYPE_DENYLIST:
+                continue
+
+            event_db = mappers.event(event)
 
             if event.victimDamageDealt:
                 event_db.victimDamageDealt = self._get_victim_damages_dealt(event, participant_id_to_participant)
@@ -251,84 +342,409 @@ class Collector:
 
         return events_db
 
+    @staticmethod
+    def _get_participant_frame_values(frame: FramesTimeLineDto) -> dict[int, dict]:
+        return {
+            participant_frame.participantId: mappers.participant_frame.values(
+                participant_frame,
+                participant_frame.championStats,
+                participant_frame.damageStats,
+                participant_frame.position
+            )
+            for participant_frame in frame.participantFrames.values()
+        }
+
+    @staticmethod
+    def _set_timelines(
+            match: Match,
+            participant_id_to_participant: dict[int, Participant],
+            timestamps: list[int],
+            values: list[dict[int, dict]]
+    ):
+        for participant_id, participant in participant_id_to_participant.items():
+            # a participant missing from a frame gets nulls there, so every array is indexed by frame
+            frames = [frame.get(participant_id, {}) for frame in values]
+            timeline = ParticipantTimeline(
+                timestamp=timestamps, **{stat: [frame.get(stat) for frame in frames] for stat in TIMELINE_STATS}
+            )
+
+            timeline.match = match
+            participant.timeline = timeline
+
     @staticmethod
     def _get_participant_frames(
-            frame: FramesTimeLineDto, participant_id_to_participant: dict[int, Participant]
+            match: Match, frame: FramesTimeLineDto, participant_id_to_participant: dict[int, Participant]
     ) -> list[ParticipantFrame]:
         participant_frames_db = []
         for participant_id, participant_frames in frame.participantFrames.items():
-            participant_frame_db = ParticipantFrame.model_validate(
-                participant_frames.model_dump() |
-                participant_frames.championStats.model_dump() |
-                participant_frames.damageStats.model_dump() |
-                participant_frames.position.model_dump()
+            participant_frame_db = mappers.participant_frame(
+                participant_frames,
+                participant_frames.championStats,
+                participant_frames.damageStats,
+                participant_frames.position
             )
 
             participant_frame_db.participant = participant_id_to_participant[participant_frames.participantId]
+            participant_frame_db.match = match
             participant_frames_db.append(participant_frame_db)
 
         return participant_frames_db
 
     def _get_frames(
-            self, timeline: TimelineDto, match: Match, participants: list[Participant], teams: list[Team]
-    ) -> list[Frame]:
+            self, frames: Iterator[FramesTimeLineDto], match: Match, participants: list[Participant], teams: list[Team]
+    ) -> Iterator[Frame]:
         participant_id_to_participant = {participant.participantId: participant for participant in participants}
         team_id_to_team = {team.teamId: team for team in teams}
 
-        frames_db = []
-        for frame in timeline.info.frames:
+        # packed participant frames are gathered by frame and become timelines once the frames are over
+        timestamps, values = [], []
+
+        for number, frame in enumerate(frames):
             frame_db = Frame(timestamp=frame.timestamp)
 
             frame_db.events = self._get_events(match, frame, participant_id_to_participant, team_id_to_team)
-            frame_db.participant_frames = self._get_participant_frames(frame, participant_id_to_participant)
 
-            frames_db.append(frame_db)
+            # every frame is kept for its events, participant frames only at the steps
+            if number % PARTICIPANT_FRAME_STEP == 0:
+                if PARTICIPANT_FRAMES == 'arrays':
+                    timestamps.append(frame.timestamp)
+                    values.append(self._get_participant_frame_values(frame))
+                else:
+                    frame_db.participant_frames = self._get_participant_frames(
+                        match, frame, participant_id_to_participant
+                    )
+
+            yield frame_db
 
-        return frames_db
+        if PARTICIPANT_FRAMES == 'arrays':
+            self._set_timelines(match, participant_id_to_participant, timestamps, values)
 
-    def get_match(self, match: MatchDto, timeline: TimelineDto) -> Match | None:
-        if match is None or timeline is None:
+    def get_frames(self, timeline: TimelineStream, match: Match) -> Iterator[Frame]:
+        yield from self._get_frames(timeline.frames(), match, match.participants, match.teams)
+
+        # the rest of the timeline is known only after its frames
+        match.frameInterval = timeline.info.frameInterval
+
+    def get_match(self, match: MatchDto, timeline: TimelineDto | TimelineStream | None) -> Match | None:
+        if match is None:
             return
 
-        match_db = Match.model_validate(match.info.model_dump() | match.metadata.model_dump())
+        match_db = mappers.match(match.info, match.metadata)
 
-        challenges = self.db.add_challenges(match)
+        challenges = self.db.add_challenges(match) if CHALLENGES == 'rows' else None
         participants = self._get_participants(match, challenges)
         teams = self._get_teams(match, participants)
-        frames = self._get_frames(timeline, match_db, participants, teams)
 
-        match_db.frameInterval = timeline.info.frameInterval
         match_db.participants = participants
         match_db.teams = teams
-        match_db.frames = frames
+
+        # a filtered match is kept without its timeline, and frames of a stream are built while they're written
+        if timeline is not None and not isinstance(timeline, TimelineStream):
+            match_db.frameInterval = timeline.info.frameInterval
+            match_db.frames = list(self._get_frames(iter(timeline.info.frames), match_db, participants, teams))
 
         return match_db
 
-    def start(self, start_id: int):
-        self.index = start_id
-        self.last_founded = self.index - 1
+    def fetch(self, job: Job) -> bool:
+        if self.db.is_match_ingested(self.region, job.index):
+            logger.warning(f'match with matchId = {self.match_id(job.index)} already in db')
+            job.found = True
+            return False
 
-        while True:
-            if self.error_counter > ERROR_COUNT_EXCEEDED:
-                logger.critical(f'error counter exceeded: {self.error_counter}')
-                sys.exit(1)
+        # the data of a new job is the match a probe has already found, if any
+        match, timeline = self.get_match_and_timeline(job.index, job.data)
+        if match is None:
+            return False
 
-            try:
-                if not self.db.is_match_in_db(self.matchId):
-                    match = self.get_match(*self.get_match_and_timeline())
+        job.found = True
+        job.data = match, timeline
+        if timeline is None:
+            return KEEP_FILTERED_MATCHES and not self.is_wanted(match)
 
-                    if match:
-                        self.db.add_match(match)
-                        logger.info(f'match and timeline with id = {self.index} are inserted')
+        return True
 
-                else:
-                    logger.warning(f'match with matchId = {self.matchId} already in db')
+    def transform(self, job: Job) -> bool:
+        match, timeline = job.data
+
+        match_db = self.get_match(match, timeline)
+        frames = self.get_frames(timeline, match_db) if isinstance(timeline, TimelineStream) else None
+
+        job.data = match_db, frames
+        return match_db is not None
+
+    def write(self, job: Job) -> bool:
+        self.db.add_match(*job.data)
+        logger.info(f'match and timeline with id = {self.match_id(job.index)} are inserted')
+        return False
+
+    def write_batch(self, jobs: list[Job]) -> list[bool]:
+        try:
+            errors = self.db.add_matches([job.data for job in jobs])
+
+        except Exception as err:
+            # nothing of a batch that failed as a whole is written, e.g. its commit or connection failed,
+            # so its matches are fetched and written again, streamed frames can't be read twice
+            logger.error(f'batch of {len(jobs)} matches failed {err}: {traceback.format_exc()}')
+            time.sleep(RETRY_BACKOFF)
+
+            for job in jobs:
+                job.retry = err
+            return [False] * len(jobs)
+
+        for job, error in zip(jobs, errors):
+            if error is not None:
+                job.error = error
+                job.traceback = ''.join(traceback.format_exception(error))
+            else:
+                logger.info(f'match and timeline with id = {self.match_id(job.index)} are inserted')
+
+        return [False] * len(jobs)
+
+    def exists(self, index: int) -> bool:
+        if self.db.is_match_ingested(self.region, index):
+            return True
+
+        match = self.get(self.api.match.by_id, region=self.region.platform, match_id=self.match_id(index))
+        if match is not None:
+            self.probed[index] = match
+
+        return match is not None
+
+    def find_existing(self, index: int, end: int | None = None) -> int | None:
+        # a single missing id inside a dense stretch isn't taken for a gap
+        for candidate in range(index, index + PROBE_WIDTH if end is None else min(index + PROBE_WIDTH, end)):
+            if self.exists(candidate):
+                return candidate
+
+        return None
+
+    def probe_gap(self, start: int, end: int | None = None) -> int | None:
+        logger.warning(
+            f'gap probing started: region = {self.region}, last_founded = {self.last_founded}, index = {start}'
+        )
+
+        # what the last probe found is behind the walk by now
+        self.probed.clear()
+
+        # exponential stride until an existing id is hit ...
+        # the budget is counted in windows, one window costs up to PROBE_WIDTH calls
+        budget = PROBE_BUDGET
+        low, high, stride = start - 1, None, 1
+        while high is None:
+            if budget == 0:
+                # past a leased range, nothing within the whole budget is the live frontier, the ids aren't
+                # played yet, so the range is left open instead of being skipped to its end
+                if end is not None:
+                    logger.warning(f'live frontier reached: region = {self.region}, nothing from {start} to {low}')
+                    return None
+
+                raise CollectorExit(
+                    f'PROBE_BUDGET exhausted: region = {self.region}, last_founded = {self.last_founded}, index = {low}'
+                )
+
+            budget -= 1
+            if (found := self.find_existing(low + stride)) is not None:
+                high = found
+            else:
+                low += stride + PROBE_WIDTH - 1
+                stride *= 2
+
+        # ... then bisection back to the first existing one, past the end of a leased range as well,
+        # so the dead ranges after it are known
+        while high - low > 1 and budget > 0:
+            budget -= 1
+            middle = (low + high) // 2
+            if (found := self.find_existing(middle, high)) is not None:
+                high = found
+            else:
+                low = min(middle + PROBE_WIDTH - 1, high - 1)
+
+        logger.warning(
+            f'gap skipped: region = {self.region}, from {start} to {high} with {PROBE_BUDGET - budget} probe windows'
+        )
+        return high
+
+    def count_error(self, error: Exception):
+        # the jobs of a batch share the error it failed with, so a batch is one error however big
+        if error is not self.last_error:
+            self.error_counter += 1
+            self.last_error = error
+
+    def consume(self, job: Job):
+        if job.error is not None:
+            logger.error(f'unexpected error {job.error}: {job.traceback}')
+            self.count_error(job.error)
+            return
+
+        if job.found:
+            self.last_founded = self.index
+
+        self.error_counter = 0
 
-                self.error_counter = 0
+    def checkpoint(self, lease: Lease | None = None) -> bool:
+        # every id up to self.index is consumed, so the cursor is the next one
+        if lease is not None:
+            return self.db.heartbeat_lease(lease, self.index + 1, self.last_founded)
+
+        self.db.save_checkpoint(self.region, self.index + 1, self.last_founded)
+        return True
+
+    def run(
+            self, start: int, end: int | None = None, *, last_founded: int | None = None, lease: Lease | None = None
+    ) -> bool:
+        self.index = start - 1
+        self.last_founded = start - 1 if last_founded is None else last_founded
+        self.found_past_end = None
+
+        interval = LEASE_HEARTBEAT if lease is not None else CHECKPOINT_INTERVAL
+        checkpointed = time.monotonic()
+
+        # fetching, transforming and writing run in their own stages, but ids are consumed
+        # strictly in order, so the last_founded bookkeeping sees the same sequence as a sequential walk
+        pipeline = Pipeline(
+            f'{NAME}-{self.region}',
+            [
+                (self.fetch, FETCH_WORKERS),
+                (self.transform, TRANSFORM_WORKERS),
+                (self.write_batch, WRITE_WORKERS, WRITE_BATCH_SIZE, WRITE_BATCH_LATENCY)
+            ],
+            QUEUE_SIZE
+        )
+        completed: dict[int, Job] = {}
+        in_flight = 0
+        next_index = start
 
+        try:
+            # a range whose tail is missed is done only after a probe past its end finds something
+            while in_flight or end is None or next_index < end or self.last_founded < end - 1:
+                if self.stop.is_set():
+                    return False
+
+                # the window is counted from the consumed cursor, so finished ids waiting
+                # for a slow one still hold their place; no new ids while in a gap either,
+                # and none into a full queue, finished jobs are consumed in the meantime
+                while (
+                        next_index - self.index <= IN_FLIGHT and
+                        not pipeline.full() and
+                        (end is None or next_index < end) and
+                        self.index - self.last_founded < NOT_FOUNDED_PROBE
+                ):
+                    job = Job(next_index)
+                    # the match found by the probe isn't requested again
+                    job.data = self.probed.pop(next_index, None)
+                    pipeline.put(job)
+                    next_index += 1
+                    in_flight += 1
+
+                if not in_flight:
+                    try:
+                        next_index = self.probe_gap(next_index, end)
+                        if next_index is None:
+                            # the lease is kept from the last found id, the misses after it are fetched again
+                            self.index = self.last_founded
+                            return False
+
+                        # the rest of a leased range is dead, and so are the ranges up to the found id
+                        if end is not None and next_index > end:
+                            self.found_past_end = next_index
+                            next_index = end
+
+                        self.index = self.last_founded = next_index - 1
+
+                    except CollectorExit:
+                        raise
+
+                    except Exception as err:
+                        logger.error(f'unexpected error while probing {err}: {traceback.format_exc()}')
+                        self.count_error(err)
+
+                else:
+                    job = pipeline.get()
+                    in_flight -= 1
+
+                    # a retried id isn't consumed, so neither the cursor nor the checkpoint gets past it
+                    if job.retry is not None:
+                        self.count_error(job.retry)
+                        pipeline.put(Job(job.index))
+                        in_flight += 1
+
+                    else:
+                        completed[job.index] = job
+                        while self.index + 1 in completed:
+                            self.index += 1
+                            self.consume(completed.pop(self.index))
+
+                if self.error_counter > ERROR_COUNT_EXCEEDED:
+                    raise CollectorExit(f'error counter exceeded: {self.error_counter}, region = {self.region}')
+
+                if time.monotonic() - checkpointed > interval:
+                    if not self.checkpoint(lease):
+                        logger.error(f'lease is lost: region = {self.region}, {lease.start}..{lease.end}')
+                        return False
+
+                    checkpointed = time.monotonic()
+
+        finally:
+            pipeline.stop()
+            # a lost lease belongs to another worker now, and the update is refused for it;
+            # a failed checkpoint is only logged, so it doesn't replace the error the loop is leaving with
+            try:
+                self.checkpoint(lease)
             except Exception as err:
-                logger.error(f'unexpected error {err}: {traceback.format_exc()}')
-                self.error_counter += 1
+                logger.error(f'checkpoint failed: region = {self.region}, {err}: {traceback.format_exc()}')
+
+        return True
+
+    def get_resume_point(self, start_id: int) -> tuple[int, int | None]:
+        match RESUME_FROM:
+            case 'checkpoint':
+                checkpoint = self.db.load_checkpoint(self.region)
+                if checkpoint is not None:
+                    return checkpoint.cursor, checkpoint.last_founded
+
+            case 'matches':
+                game_id = self.db.get_max_game_id(self.region)
+                if game_id is not None:
+                    return game_id + 1, game_id
+
+            case None:
+                pass
+
+            case _:
+                raise ValueError('RESUME_FROM must be checkpoint, matches or None')
+
+        return start_id, None
 
-            # break
-            self.index += 1
+    def start(self, start_id: int):
+        start, last_founded = self.get_resume_point(start_id)
+        logger.info(f'collecting started: region = {self.region}, from {start}')
+
+        self.run(start, last_founded=last_founded)
+
+    def start_leased(self, origin: int):
+        owner = f'{socket.gethostname()}:{os.getpid()}:{self.region}'
+
+        # the origin only matters until the region has its first lease
+        if RESUME_FROM == 'matches' and (game_id := self.db.get_max_game_id(self.region)) is not None:
+            origin = game_id + 1
+
+        while not self.stop.is_set():
+            lease = self.db.claim_lease(self.region, origin, owner)
+            logger.info(f'lease claimed: region = {self.region}, {lease.start}..{lease.end} from {lease.cursor}')
+
+            if self.run(lease.cursor, lease.end, last_founded=lease.last_founded, lease=lease):
+                self.db.complete_lease(lease)
+                logger.info(f'lease completed: region = {self.region}, {lease.start}..{lease.end}')
+
+                # the dead ranges up to the found id are done without being claimed
+                if self.found_past_end is not None and (
+                        skipped := self.db.skip_leases(self.region, self.found_past_end)
+                ) is not None:
+                    logger.info(f'dead ranges skipped: region = {self.region}, {skipped[0]}..{skipped[1]}')
+
+            # an open range is given back, at the live frontier it's claimed again after a while
+            elif self.db.release_lease(lease):
+                logger.info(
+                    f'lease released: region = {self.region}, {lease.start}..{lease.end} from {self.index + 1}'
+                )
+                self.stop.wait(FRONTIER_BACKOFF)
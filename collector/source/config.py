@@ -10,9 +10,91 @@ import requests
 NAME = 'Collector'
 
 ERROR_COUNT_EXCEEDED = 10
-NOT_FOUNDED_WARNING = 100
-NOT_FOUNDED_ERROR = 250
-NOT_FOUNDED_EXIT = 500
+NOT_FOUNDED_PROBE = 100
+# a gap is probed in at most PROBE_BUDGET steps, a step checks a window of up to PROBE_WIDTH ids,
+# so it costs up to PROBE_BUDGET * PROBE_WIDTH calls and reaches about 2 ** PROBE_BUDGET ids ahead
+PROBE_BUDGET = 24
+PROBE_WIDTH = 3
+
+# an empty allowlist allows everything, a match gets its timeline only when it's allowed by every allowlist
+# and isn't in any denylist; nothing is filtered by default, to collect only ranked solo and flex on
+# Summoner's Rift set QUEUE_ALLOWLIST = {420, 440}, and e.g. GAME_MODE_DENYLIST = {'ARAM', 'CHERRY', 'PRACTICETOOL'}
+# or GAME_TYPE_DENYLIST = {'CUSTOM_GAME', 'TUTORIAL_GAME'} skip those modes and types
+QUEUE_ALLOWLIST = set()
+QUEUE_DENYLIST = set()
+GAME_MODE_ALLOWLIST = set()
+GAME_MODE_DENYLIST = set()
+GAME_TYPE_ALLOWLIST = set()
+GAME_TYPE_DENYLIST = set()
+# filtered matches are stored without timeline, participants and teams are kept
+KEEP_FILTERED_MATCHES = True
+# events of these types aren't stored, e.g. {'SKILL_LEVEL_UP', 'ITEM_UNDO', 'WARD_PLACED'}
+EVENT_TYPE_DENYLIST = set()
+# participant frames are stored every that many frames, a frame is a minute, 5 keeps 0, 5, 10... minutes
+PARTICIPANT_FRAME_STEP = 1
+if PARTICIPANT_FRAME_STEP < 1:
+    raise ValueError('PARTICIPANT_FRAME_STEP must be 1 or more frames')
+
+# pydantic or msgspec, both give the same data, msgspec decodes several times faster
+PARSER = 'pydantic'
+# timelines are parsed and written frame by frame, so a worker never holds a whole one
+STREAM_TIMELINES = False
+# participant frames as a row per frame (rows) or as one row of arrays per participant (arrays)
+PARTICIPANT_FRAMES = 'rows'
+# challenges as a row per challenge with its value as a string (rows) or as a jsonb column of participant (jsonb),
+# jsonb keeps the types of the values and writes a row per participant instead of about a hundred
+CHALLENGES = 'rows'
+# events in one wide table (wide) or by type in tables of their own columns (sparse), sparse needs BULK_WRITE
+EVENTS = 'wide'
+# the whole graph of a match is written with binary COPY instead of the orm, several times faster,
+# equivalence.py checks that both write the same data
+BULK_WRITE = False
+# primary keys of the copied rows are reserved from the sequences that many at a time
+ID_BLOCK_SIZE = 10_000
+# events and participant frames are partitioned by ranges of that many match ids,
+# partitions are created that many ranges ahead of the matches being written
+PARTITION_SIZE = 10_000
+PARTITION_AHEAD = 2
+
+# the window has to be well over the write batch, ids behind an open batch hold their place in it
+IN_FLIGHT = 128
+FETCH_WORKERS = 8
+TRANSFORM_WORKERS = 2
+WRITE_WORKERS = 2
+# a write worker commits once it has gathered that many matches or waited that many seconds
+WRITE_BATCH_SIZE = 50
+WRITE_BATCH_LATENCY = 2
+QUEUE_SIZE = 8
+
+HTTP_POOL_SIZE = FETCH_WORKERS
+# connect and read timeouts in seconds
+HTTP_TIMEOUT = (3.05, 15)
+
+# raw responses are archived when the path is set
+ARCHIVE_PATH = None
+ARCHIVE_SEGMENT_SIZE = 256 * 1024 * 1024
+ARCHIVE_LEVEL = 3
+
+LEASE_SIZE = 10_000
+LEASE_TTL = 300
+LEASE_HEARTBEAT = 30
+# a lease at the live frontier is claimed again after that many seconds
+FRONTIER_BACKOFF = 60
+
+# checkpoint, matches or None
+RESUME_FROM = 'checkpoint'
+CHECKPOINT_INTERVAL = 30
+# ids of matches inserted by other workers are picked up that often, in seconds
+INGESTED_SYNC_INTERVAL = 300
+
+RETRY_BACKOFF = 1
+# 429s are retried apart from the other errors, as each one is already waited out
+RATE_LIMITED_RETRIES = 20
+RETRY_AFTER_DEFAULT = 1
+APP_RATE_LIMIT = '20:1,100:120'
+METHOD_RATE_LIMIT = '2000:10'
+RATE_LIMIT_MARGIN = 0.9
+RATE_LIMIT_BURST = 0.1
 
 API_KEY_PATH = '/run/secrets/secrets.json'
 API_KEY_PATH_DEBUG = '../../secrets.json'
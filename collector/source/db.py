@@ -1,12 +1,40 @@
-from datetime import datetime, UTC
-from typing import List, Union
+import threading
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Any, Iterable, List, Union
 
+from psycopg import Cursor
 from pydantic import field_validator
-from sqlalchemy.dialects.postgresql import insert
-from sqlmodel import SQLModel, Field, Column, Enum, Relationship, create_engine, Session, select
-
-from config import get_logger
-from enums import Region, GameMode, GameType, Lane, LaneDB, Role, Tower
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert
+from sqlalchemy import (
+    inspect,
+    BigInteger,
+    Connection,
+    Constraint,
+    DateTime,
+    ForeignKeyConstraint,
+    Integer,
+    PrimaryKeyConstraint,
+    UniqueConstraint,
+    text
+)
+from sqlmodel import SQLModel, Field, Column, Enum, Relationship, create_engine, Session, select, update, func, col, or_
+
+from bitmap import Bitmap
+from bulk import Copy, Keys, get_value
+from config import (
+    get_logger,
+    BULK_WRITE,
+    EVENTS,
+    ID_BLOCK_SIZE,
+    INGESTED_SYNC_INTERVAL,
+    LEASE_SIZE,
+    LEASE_TTL,
+    PARTITION_AHEAD,
+    PARTITION_SIZE
+)
+from enums import Region, Platform, GameMode, GameType, Lane, LaneDB, Role, Tower
 from models import MatchDto
 
 logger = get_logger(__name__)
@@ -17,19 +45,24 @@ def utcnow() -> datetime:
 
 
 class Match(SQLModel, table=True):
+    # the key of a match, matchId is derived from it
+    __table_args__ = (UniqueConstraint('platformId', 'gameId'),)
+
     id: int | None = Field(None, primary_key=True)
-    inserted: datetime = Field(default_factory=utcnow)
+    # by the server, the clocks of workers don't matter for the sync of ingested ids
+    inserted: datetime | None = Field(
+        None, sa_column=Column(DateTime, server_default=text("timezone('utc', now())"), index=True)
+    )
 
     # MetadataDto
     dataVersion: str | None = None
-    matchId: str | None = Field(None, unique=True)  # Unique constraint added
 
     # InfoDto
     endOfGameResult: str | None = None
     gameCreation: datetime | None = None
     gameDuration: int | None = None
     gameEndTimestamp: datetime | None = None
-    gameId: int | None = None
+    gameId: int | None = Field(None, sa_column=Column(BigInteger))
     gameMode: GameMode | None = Field(None, sa_column=Column(Enum(GameMode)))
     gameName: str | None = None
     gameStartTimestamp: datetime | None = None
@@ -43,6 +76,18 @@ class Match(SQLModel, table=True):
     # InfoTimeLineDto
     frameInterval: int | None = None
 
+    @field_validator('platformId', mode='before')
+    def convert_platform_to_region(cls, platform: Platform | None) -> Region | None:
+        return platform.region if isinstance(platform, Platform) else platform
+
+    # noinspection PyPep8Naming
+    @property
+    def matchId(self) -> str | None:
+        if self.platformId is None or self.gameId is None:
+            return None
+
+        return f'{self.platformId.platform}_{self.gameId}'
+
     # List[ParticipantDto]
     participants: List['Participant'] | None = Relationship(back_populates='match')
     # List[TeamDto]
@@ -61,7 +106,11 @@ class ChallengeParticipantLink(SQLModel, table=True):
 
 
 class AssistingParticipantsLink(SQLModel, table=True):
-    event_id: int | None = Field(default=None, foreign_key='event.id', primary_key=True)
+    # the key of a partitioned event is its id with its match
+    __table_args__ = (ForeignKeyConstraint(['event_id', 'gameId'], ['event.id', 'event.gameId']),)
+
+    event_id: int | None = Field(default=None, primary_key=True)
+    gameId: int | None = None
     participant_id: int | None = Field(default=None, foreign_key='participant.id', primary_key=True)
 
 
@@ -228,7 +277,8 @@ class Participant(SQLModel, table=True):
     match: Match = Relationship(back_populates='participants')
     team: Union['Team', None] = Relationship(back_populates='participants')
 
-    # dict[str, str]
+    # ChallengesDto, typed values by name, or as rows of strings when CHALLENGES is rows
+    challenges: dict[str, Any] | None = Field(None, sa_column=Column(JSONB))
     challenge_links: List[ChallengeParticipantLink] | None = Relationship(back_populates='participant')
     # MissionsDto
     missions: Union['Missions', None] = Relationship(back_populates='participant')
@@ -236,6 +286,8 @@ class Participant(SQLModel, table=True):
     perks: List['Perk'] | None = Relationship(back_populates='participant')
     # List[ParticipantFramesDto]
     participant_frames: List['ParticipantFrame'] | None = Relationship(back_populates='participant')
+    # the same, packed
+    timeline: Union['ParticipantTimeline', None] = Relationship(back_populates='participant')
 
 
 class Challenge(SQLModel, table=True):
@@ -336,13 +388,16 @@ class Frame(SQLModel, table=True):
 
 
 class Event(SQLModel, table=True):
-    id: int | None = Field(None, primary_key=True)
+    # ranges of matches, the partition key has to be part of the primary key
+    __table_args__ = {'postgresql_partition_by': 'RANGE ("gameId")'}
+
+    id: int | None = Field(None, primary_key=True, sa_column_kwargs={'autoincrement': True})
 
     timestamp: int | None = None
     type: str | None = None
 
     realTimestamp: datetime | None = None
-    gameId: int | None = Field(None, foreign_key='match.id')
+    gameId: int | None = Field(None, foreign_key='match.id', primary_key=True)
     winningTeamId: int | None = Field(None, foreign_key='team.id')  # original name winningTeam
     itemId: int | None = None
     participantId: int | None = Field(None, foreign_key='participant.id')
@@ -391,7 +446,106 @@ class Event(SQLModel, table=True):
     frame: Frame = Relationship(back_populates='events')
 
 
+class SparseEvent(SQLModel):
+    # the columns of every event type, the keys of all event tables come from the sequence of event
+    id: int | None = Field(None, primary_key=True)
+
+    timestamp: int | None = None
+    type: str | None = None
+
+    gameId: int | None = Field(None, foreign_key='match.id', primary_key=True)
+    frame_id: int | None = Field(None, foreign_key='frame.id')
+
+
+class ItemEvent(SparseEvent, table=True):
+    # ITEM_PURCHASED, ITEM_DESTROYED, ITEM_SOLD, ITEM_UNDO
+    __table_args__ = {'postgresql_partition_by': 'RANGE ("gameId")'}
+
+    participantId: int | None = Field(None, foreign_key='participant.id')
+    itemId: int | None = None
+    afterId: int | None = None
+    beforeId: int | None = None
+    goldGain: int | None = None
+
+
+class SkillEvent(SparseEvent, table=True):
+    # SKILL_LEVEL_UP, LEVEL_UP
+    __table_args__ = {'postgresql_partition_by': 'RANGE ("gameId")'}
+
+    participantId: int | None = Field(None, foreign_key='participant.id')
+    levelUpType: str | None = None
+    skillSlot: int | None = None
+    level: int | None = None
+
+
+class WardEvent(SparseEvent, table=True):
+    # WARD_PLACED, WARD_KILL
+    __table_args__ = {'postgresql_partition_by': 'RANGE ("gameId")'}
+
+    creatorId: int | None = Field(None, foreign_key='participant.id')
+    killerId: int | None = Field(None, foreign_key='participant.id')
+    wardType: str | None = None
+
+
+class KillEvent(SparseEvent, table=True):
+    # CHAMPION_KILL, CHAMPION_SPECIAL_KILL
+    __table_args__ = {'postgresql_partition_by': 'RANGE ("gameId")'}
+
+    killerId: int | None = Field(None, foreign_key='participant.id')
+    victimId: int | None = Field(None, foreign_key='participant.id')
+    killStreakLength: int | None = None
+    x: int | None = None
+    y: int | None = None
+    bounty: int | None = None
+    shutdownBounty: int | None = None
+    killType: str | None = None
+    multiKillLength: int | None = None
+
+
+class ObjectiveEvent(SparseEvent, table=True):
+    # BUILDING_KILL, TURRET_PLATE_DESTROYED, ELITE_MONSTER_KILL, DRAGON_SOUL_GIVEN, OBJECTIVE_BOUNTY_*
+    __table_args__ = {'postgresql_partition_by': 'RANGE ("gameId")'}
+
+    killerId: int | None = Field(None, foreign_key='participant.id')
+    teamId: int | None = Field(None, foreign_key='team.id')
+    killerTeamId: int | None = Field(None, foreign_key='team.id')
+    x: int | None = None
+    y: int | None = None
+    bounty: int | None = None
+    buildingType: str | None = None
+    towerType: Tower | None = Field(None, sa_column=Column(Enum(Tower)))
+    laneType: str | None = None
+    monsterType: str | None = None
+    monsterSubType: str | None = None
+    actualStartTime: int | None = None
+    name: str | None = None
+
+
+# tables of event types when EVENTS is sparse, any other type is kept in event
+EVENT_TABLES: dict[str, type[SparseEvent]] = {
+    'ITEM_PURCHASED': ItemEvent,
+    'ITEM_DESTROYED': ItemEvent,
+    'ITEM_SOLD': ItemEvent,
+    'ITEM_UNDO': ItemEvent,
+    'SKILL_LEVEL_UP': SkillEvent,
+    'LEVEL_UP': SkillEvent,
+    'WARD_PLACED': WardEvent,
+    'WARD_KILL': WardEvent,
+    'CHAMPION_KILL': KillEvent,
+    'CHAMPION_SPECIAL_KILL': KillEvent,
+    'BUILDING_KILL': ObjectiveEvent,
+    'TURRET_PLATE_DESTROYED': ObjectiveEvent,
+    'ELITE_MONSTER_KILL': ObjectiveEvent,
+    'DRAGON_SOUL_GIVEN': ObjectiveEvent,
+    'OBJECTIVE_BOUNTY_PRESTART': ObjectiveEvent,
+    'OBJECTIVE_BOUNTY_FINISH': ObjectiveEvent
+}
+SPARSE_EVENTS = (ItemEvent, SkillEvent, WardEvent, KillEvent, ObjectiveEvent)
+
+
 class VictimDamageDealt(SQLModel, table=True):
+    __table_args__ = (ForeignKeyConstraint(['event_id', 'gameId'], ['event.id', 'event.gameId']),)
+
     id: int | None = Field(None, primary_key=True)
 
     basic: bool | None = None
@@ -404,12 +558,15 @@ class VictimDamageDealt(SQLModel, table=True):
     trueDamage: int | None = None
     type: str | None = None
 
-    event_id: int | None = Field(None, foreign_key='event.id')
+    event_id: int | None = None
+    gameId: int | None = None
     event: Event = Relationship(back_populates='victimDamageDealt')
     participant: Participant | None = Relationship()
 
 
 class VictimDamageReceived(SQLModel, table=True):
+    __table_args__ = (ForeignKeyConstraint(['event_id', 'gameId'], ['event.id', 'event.gameId']),)
+
     id: int | None = Field(None, primary_key=True)
 
     basic: bool | None = None
@@ -422,13 +579,16 @@ class VictimDamageReceived(SQLModel, table=True):
     trueDamage: int | None = None
     type: str | None = None
 
-    event_id: int | None = Field(None, foreign_key='event.id')
+    event_id: int | None = None
+    gameId: int | None = None
     event: Event = Relationship(back_populates='victimDamageReceived')
     participant: Participant | None = Relationship()
 
 
 class ParticipantFrame(SQLModel, table=True):
-    id: int | None = Field(None, primary_key=True)
+    __table_args__ = {'postgresql_partition_by': 'RANGE (match_id)'}
+
+    id: int | None = Field(None, primary_key=True, sa_column_kwargs={'autoincrement': True})
 
     # ParticipantFrameDto
     currentGold: int | None = None
@@ -489,56 +649,750 @@ class ParticipantFrame(SQLModel, table=True):
     frame_id: int | None = Field(None, foreign_key='frame.id')
     frame: Frame = Relationship(back_populates='participant_frames')
     participant: Participant = Relationship(back_populates='participant_frames')
+    match_id: int | None = Field(None, foreign_key='match.id', primary_key=True)
+    match: Match = Relationship()
+
+
+class ParticipantTimeline(SQLModel, table=True):
+    # the participant frames of a participant in one row, a stat is an array by frame number
+    match_id: int | None = Field(None, foreign_key='match.id', primary_key=True)
+    participantId: int | None = Field(None, foreign_key='participant.id', primary_key=True)
+
+    # FramesTimeLineDto
+    timestamp: List[int] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+
+    # ParticipantFrameDto
+    currentGold: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    goldPerSecond: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    jungleMinionsKilled: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    level: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    minionsKilled: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    timeEnemySpentControlled: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    totalGold: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    xp: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+
+    # ChampionStatsDto
+    abilityHaste: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    abilityPower: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    armor: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    armorPen: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    armorPenPercent: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    attackDamage: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    attackSpeed: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    bonusArmorPenPercent: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    bonusMagicPenPercent: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    ccReduction: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    cooldownReduction: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    health: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    healthMax: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    healthRegen: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    lifesteal: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    magicPen: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    magicPenPercent: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    magicResist: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    movementSpeed: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    omnivamp: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    physicalVamp: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    power: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    powerMax: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    powerRegen: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    spellVamp: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+
+    # DamageStatsDto
+    magicDamageDone: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    magicDamageDoneToChampions: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    magicDamageTaken: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    physicalDamageDone: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    physicalDamageDoneToChampions: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    physicalDamageTaken: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    totalDamageDone: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    totalDamageDoneToChampions: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    totalDamageTaken: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    trueDamageDone: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    trueDamageDoneToChampions: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    trueDamageTaken: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+
+    # PositionDto
+    x: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+    y: List[int | None] | None = Field(None, sa_column=Column(ARRAY(Integer)))
+
+    match: Match = Relationship()
+    participant: Participant = Relationship(back_populates='timeline')
+
+    def series(self, stat: str) -> list[tuple[int, int | None]]:
+        return list(zip(self.timestamp, getattr(self, stat)))
+
+    def frames(self) -> list[dict[str, int | None]]:
+        # the rows of participantframe, without keys
+        columns = [getattr(self, stat) for stat in TIMELINE_STATS]
+        return [
+            {'timestamp': timestamp} | dict(zip(TIMELINE_STATS, values))
+            for timestamp, *values in zip(self.timestamp, *columns)
+        ]
+
+
+TIMELINE_STATS = [
+    name for name in ParticipantTimeline.model_fields if name not in ('match_id', 'participantId', 'timestamp')
+]
+
+# participanttimeline unpacked into a row per frame, like participantframe
+TIMELINE_COLUMNS = [f'"{name}"' for name in ['timestamp', *TIMELINE_STATS]]
+TIMELINE_VIEW = f"""
+CREATE OR REPLACE VIEW participanttimeline_frame AS
+SELECT timeline.match_id, timeline."participantId", frame.number - 1 AS frame,
+       {', '.join(f'frame.{column}' for column in TIMELINE_COLUMNS)}
+FROM participanttimeline timeline,
+     unnest({', '.join(f'timeline.{column}' for column in TIMELINE_COLUMNS)})
+     WITH ORDINALITY AS frame({', '.join(TIMELINE_COLUMNS)}, number)
+"""
+
+
+class Lease(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint('region', 'start'),)
+
+    id: int | None = Field(None, primary_key=True)
+
+    region: Region = Field(sa_column=Column(Enum(Region), nullable=False))
+    start: int = Field(sa_column=Column(BigInteger, nullable=False))
+    end: int = Field(sa_column=Column(BigInteger, nullable=False))
+    cursor: int = Field(sa_column=Column(BigInteger, nullable=False))
+    last_founded: int = Field(sa_column=Column(BigInteger, nullable=False))
+    done: bool = False
+
+    owner: str | None = None
+    heartbeat: datetime | None = None
+
+
+class Checkpoint(SQLModel, table=True):
+    region: Region = Field(sa_column=Column(Enum(Region), primary_key=True))
+    cursor: int = Field(sa_column=Column(BigInteger, nullable=False))
+    last_founded: int = Field(sa_column=Column(BigInteger, nullable=False))
+    updated: datetime = Field(default_factory=utcnow)
+
+
+# the tables of sparse events are created and maintained only when events are written to them
+TABLES = [
+    table for table in SQLModel.metadata.sorted_tables
+    if EVENTS == 'sparse' or table not in [model.__table__ for model in SPARSE_EVENTS]
+]
+
+# tables partitioned by ranges of PARTITION_SIZE match ids
+PARTITIONED = (Event, ParticipantFrame, *(SPARSE_EVENTS if EVENTS == 'sparse' else ()))
+
+# parents before children, the foreign keys are checked by every copy
+COPIES = {
+    model: Copy(model) for model in (
+        Match,
+        Team,
+        Participant,
+        Perk,
+        Missions,
+        ParticipantTimeline,
+        ChallengeParticipantLink,
+        Ban,
+        Frame,
+        Event,
+        ParticipantFrame,
+        VictimDamageDealt,
+        VictimDamageReceived,
+        AssistingParticipantsLink
+    )
+}
+
+# an event of a sparse type with a value its table has no column for is kept whole in event
+EVENT_COPIES = {Event: COPIES[Event]} | {model: Copy(Event, model.__table__) for model in SPARSE_EVENTS}
+EVENT_EXTRA = {
+    model: [
+        COPIES[Event].relationships[column.name][0] if column.name in COPIES[Event].relationships else column.name
+        for column in Event.__table__.columns if column.name not in model.__table__.columns
+    ]
+    for model in SPARSE_EVENTS
+}
+# an event with rows of its own is kept in event as well, their foreign keys are to event
+EVENT_CHILDREN = ['victimDamageDealt', 'victimDamageReceived', 'assistingParticipants']
+
+
+def get_event_table(event: Event) -> type[SQLModel]:
+    values = event.__dict__
+    model = EVENT_TABLES.get(values.get('type'))
+    if (
+            model is None or
+            any(values.get(name) is not None for name in EVENT_EXTRA[model]) or
+            any(values.get(name) for name in EVENT_CHILDREN)
+    ):
+        return Event
+
+    return model
+
+
+def get_event_view(models: Iterable[type[SQLModel]]) -> str:
+    # every event table in the columns of event
+    return 'CREATE OR REPLACE VIEW event_wide AS\n' + '\nUNION ALL\n'.join(
+        'SELECT ' + ', '.join(
+            f'"{column.name}"' if column.name in model.__table__.columns
+            else f'NULL::{column.type.compile(dialect=postgresql.dialect())} AS "{column.name}"'
+            for column in Event.__table__.columns
+        ) + f' FROM {model.__tablename__}'
+        for model in models
+    )
+
+
+def add_partitions(connection: Connection, first: int, last: int):
+    # one process at a time, the others find the partitions created
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('partitions'))"))
+
+    for number in range(first, last + 1):
+        for model in PARTITIONED:
+            # created by another process or before this one started
+            name = f'{model.__tablename__}_p{number}'
+            if connection.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar() is not None:
+                continue
+
+            # attaching takes a weaker lock on the parent than creating a partition of it, but it clones
+            # the foreign keys of the parent, which takes SHARE ROW EXCLUSIVE on match and the other
+            # referenced tables, so it waits for open batches and blocks writes of other workers until
+            # the commit; that's once per PARTITION_SIZE matches, PARTITION_AHEAD ranges ahead of them.
+            # It creates the indexes, defaults come from the parent
+            connection.execute(text(f'CREATE TABLE {name} (LIKE {model.__tablename__})'))
+            connection.execute(text(
+                f'ALTER TABLE {model.__tablename__} ATTACH PARTITION {name} '
+                f'FOR VALUES FROM ({number * PARTITION_SIZE}) TO ({(number + 1) * PARTITION_SIZE})'
+            ))
+            logger.info(f'partition {name} created')
+
+
+def get_constraint_key(constraint: Constraint) -> tuple:
+    if isinstance(constraint, ForeignKeyConstraint):
+        return (
+            'foreign key', tuple(constraint.column_keys),
+            constraint.referred_table.name, tuple(element.column.name for element in constraint.elements)
+        )
+
+    return (
+        'primary key' if isinstance(constraint, PrimaryKeyConstraint) else 'unique constraint',
+        frozenset(column.name for column in constraint.columns)
+    )
+
+
+def compare_tables(connection: Connection) -> tuple[list[Column], list[Column], list[Constraint]]:
+    # the columns the existing tables miss or have of another type, and their missing keys, unique and foreign
+    # key constraints, as the conflict handling of inserts and the partitioning rely on them
+    inspector = inspect(connection)
+    missing, retyped, constraints = [], [], []
+    for table in TABLES:
+        if not inspector.has_table(table.name):
+            continue
+
+        types = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in types:
+                missing.append(column)
+            elif types[column.name].compile(connection.dialect) != column.type.compile(connection.dialect):
+                retyped.append(column)
+
+        existing = {
+            ('primary key', frozenset(inspector.get_pk_constraint(table.name)['constrained_columns'])),
+            *(
+                ('unique constraint', frozenset(constraint['column_names']))
+                for constraint in inspector.get_unique_constraints(table.name)
+            ),
+            *(
+                (
+                    'foreign key', tuple(constraint['constrained_columns']),
+                    constraint['referred_table'], tuple(constraint['referred_columns'])
+                )
+                for constraint in inspector.get_foreign_keys(table.name)
+            )
+        }
+        constraints.extend(
+            constraint for constraint in table.constraints
+            if isinstance(constraint, (PrimaryKeyConstraint, UniqueConstraint, ForeignKeyConstraint)) and
+            get_constraint_key(constraint) not in existing
+        )
+
+    return missing, retyped, constraints
 
 
 class DB:
-    def __init__(self, postgres_user, postgres_password, postgres_host, postgres_database):
+    def __init__(self, postgres_user, postgres_password, postgres_host, postgres_database, *, pool_size: int = 5):
+        if EVENTS == 'sparse' and not BULK_WRITE:
+            raise ValueError('sparse events are written by copy only, BULK_WRITE has to be set')
+
         self.engine = create_engine(
             f'postgresql+psycopg://{postgres_user}:{postgres_password}@{postgres_host}/{postgres_database}',
-            pool_recycle=3600
+            pool_recycle=3600,
+            pool_size=pool_size
         )
 
+        # name to id of every known challenge, it only grows and is shared by all workers
+        self.challenges: dict[str, int] = {}
+        self.challenges_lock = threading.Lock()
+
+        self.keys = Keys(ID_BLOCK_SIZE)
+
+        # partitions before that number exist
+        self.next_partition = 0
+        self.partitions_lock = threading.Lock()
+
+        # game ids of the matches in the db by region, kept in sync with the inserts of this process
+        # and reloaded incrementally for the others
+        self.ingested: dict[Region, Bitmap] = {}
+        self.ingested_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.synced: datetime | None = None
+        self.next_sync = 0.0
+
     def create_tables(self):
-        SQLModel.metadata.create_all(self.engine)
+        SQLModel.metadata.create_all(self.engine, tables=TABLES)
+        self.check_tables()
+        with self.engine.begin() as connection:
+            connection.execute(text(TIMELINE_VIEW))
+
+            # tables of sparse events left by an earlier sparse mode are still read through the view
+            models = [
+                model for model in (Event, *SPARSE_EVENTS)
+                if connection.execute(text('SELECT to_regclass(:name)'), {'name': model.__tablename__}).scalar()
+            ]
+            connection.execute(text(get_event_view(models)))
+
+        self.create_partitions(self.get_last_match_id())
+
+    def check_tables(self):
+        # create_all skips the tables that exist, so a database of an older schema would fail only at its first
+        # write or lose its keys silently, migrate.py upgrades it
+        with self.engine.connect() as connection:
+            missing, retyped, constraints = compare_tables(connection)
+
+        differences = [
+            *(f'{column.table.name}.{column.name} is missing' for column in missing),
+            *(
+                f'{column.table.name}.{column.name} isn\'t {column.type.compile(self.engine.dialect)}'
+                for column in retyped
+            ),
+            *(
+                f'{constraint.table.name} has no {get_constraint_key(constraint)[0]} of '
+                f'{', '.join(column.name for column in constraint.columns)}'
+                for constraint in constraints
+            )
+        ]
+        if differences:
+            raise RuntimeError(
+                f'the database has an older schema, upgrade it with migrate.py: {'; '.join(differences)}'
+            )
+
+    def get_last_match_id(self) -> int:
+        with Session(self.engine) as session:
+            # noinspection PyDeprecation
+            return session.execute(text(
+                "SELECT coalesce(pg_sequence_last_value(pg_get_serial_sequence('match', 'id')::regclass), 0)"
+            )).scalar_one()
+
+    def create_partitions(self, match_id: int):
+        # the partition of the match and PARTITION_AHEAD after it, mostly they were created by an earlier batch
+        last = match_id // PARTITION_SIZE + PARTITION_AHEAD
+        if last < self.next_partition:
+            return
+
+        with self.partitions_lock, self.engine.begin() as connection:
+            add_partitions(connection, max(self.next_partition, match_id // PARTITION_SIZE), last)
+            self.next_partition = last + 1
 
     def drop_tables(self):
+        with self.engine.begin() as connection:
+            connection.execute(text('DROP VIEW IF EXISTS participanttimeline_frame'))
+            connection.execute(text('DROP VIEW IF EXISTS event_wide'))
         SQLModel.metadata.drop_all(self.engine)
 
-    # noinspection PyPep8Naming
-    def is_match_in_db(self, matchId: str) -> bool:
+    def is_match_in_db(self, region: Region, game_id: int) -> bool:
         with Session(self.engine) as session:
             # noinspection PyTypeChecker,Pydantic
-            if session.exec(select(Match).where(Match.matchId == matchId)).one_or_none() is not None:
+            statement = select(Match.id).where(Match.platformId == region, Match.gameId == game_id)
+            if session.exec(statement).one_or_none() is not None:
                 return True
 
         return False
 
-    def add_challenges(self, match: MatchDto) -> dict[str, Challenge]:
+    def _ingested(self, region: Region) -> Bitmap:
+        if region not in self.ingested:
+            with self.ingested_lock:
+                self.ingested.setdefault(region, Bitmap())
+
+        return self.ingested[region]
+
+    def sync_ingested(self):
+        # the first sync loads every id, the next ones only what was inserted since the previous one;
+        # inserted is the start of the transaction on the server, so the window overlaps by an interval
+        # for batches committed long after they started
+        statement = select(Match.platformId, Match.gameId).where(
+            col(Match.platformId).is_not(None), col(Match.gameId).is_not(None)
+        )
+        if self.synced is not None:
+            statement = statement.where(Match.inserted >= self.synced - timedelta(seconds=INGESTED_SYNC_INTERVAL))
+
+        count = 0
+        with Session(self.engine) as session:
+            started = session.execute(text("SELECT timezone('utc', now())")).scalar_one()
+
+            # a server side cursor, the rows are streamed instead of fetched at once
+            # noinspection PyTypeChecker
+            for region, game_id in session.exec(statement.execution_options(yield_per=100_000)):
+                self._ingested(region).add(game_id)
+                count += 1
+
+        if self.synced is None:
+            logger.info(
+                f'{count} ingested ids loaded in '
+                f'{sum(bitmap.nbytes for bitmap in self.ingested.values()) / 1024 / 1024:.1f} MiB'
+            )
+
+        self.synced = started
+        self.next_sync = time.monotonic() + INGESTED_SYNC_INTERVAL
+
+    def is_match_ingested(self, region: Region, game_id: int) -> bool:
+        # one worker syncs, the others only wait for it when nothing is loaded yet
+        if time.monotonic() >= self.next_sync and self.sync_lock.acquire(blocking=self.synced is None):
+            try:
+                if time.monotonic() >= self.next_sync:
+                    self.sync_ingested()
+            finally:
+                self.sync_lock.release()
+
+        return game_id in self._ingested(region)
+
+    def load_challenges(self):
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker
+            self.challenges.update(session.exec(select(Challenge.name, Challenge.id)).all())
+
+        logger.info(f'{len(self.challenges)} challenges loaded')
+
+    def add_challenges(self, match: MatchDto) -> dict[str, int]:
         challenges = set()
         for participant in match.info.participants:
             if participant.challenges is None:
                 continue
 
-            for challenge in participant.challenges:
-                challenges.add(challenge)
+            challenges.update(participant.challenges)
 
-        challenges_name_to_challenge = {}
-        with Session(self.engine) as session:
-            for challenge in challenges:
-                statement = insert(Challenge).values(name=challenge)
+        if challenges.issubset(self.challenges):
+            return self.challenges
+
+        with self.challenges_lock:
+            # another worker could have added them while this one waited
+            new = sorted(challenges.difference(self.challenges))
+            if not new:
+                return self.challenges
+
+            with Session(self.engine) as session:
+                # a name inserted by another process at the same time is waited for and skipped by the conflict,
+                # then the select sees it committed; sorted names keep concurrent inserts from deadlocking
+                statement = insert(Challenge).values([{'name': name} for name in new])
                 # noinspection PyDeprecation
                 session.execute(statement.on_conflict_do_nothing(index_elements=['name']))
 
                 # noinspection PyTypeChecker,Pydantic
-                challenges_name_to_challenge[challenge] = session.exec(
-                    select(Challenge).where(Challenge.name == challenge)
-                ).one()
+                ids = session.exec(select(Challenge.name, Challenge.id).where(col(Challenge.name).in_(new))).all()
+                session.commit()
+
+            self.challenges.update(ids)
+            logger.info(f'{len(new)} new challenges, {len(self.challenges)} known')
+
+        return self.challenges
+
+    def claim_lease(self, region: Region, origin: int, owner: str) -> Lease:
+        while True:
+            with Session(self.engine) as session:
+                # noinspection PyTypeChecker,Pydantic
+                lease = session.exec(
+                    select(Lease)
+                    .where(
+                        Lease.region == region,
+                        col(Lease.done).is_(False),
+                        or_(col(Lease.owner).is_(None), Lease.heartbeat < utcnow() - timedelta(seconds=LEASE_TTL))
+                    )
+                    .order_by(Lease.start)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).one_or_none()
+
+                if lease is not None:
+                    lease.owner = owner
+                    lease.heartbeat = utcnow()
+
+                    session.add(lease)
+                    session.commit()
+                    session.refresh(lease)
+                    return lease
+
+                # the pool is empty, so the next range after the last one is appended
+                # noinspection PyTypeChecker,Pydantic
+                last = session.exec(select(func.max(Lease.end)).where(Lease.region == region)).one()
+                start = origin if last is None else last
+
+                statement = insert(Lease).values(
+                    region=region,
+                    start=start,
+                    end=start + LEASE_SIZE,
+                    cursor=start,
+                    last_founded=start - 1,
+                    done=False,
+                    owner=owner,
+                    heartbeat=utcnow()
+                )
+                # noinspection PyDeprecation
+                lease_id = session.execute(
+                    statement.on_conflict_do_nothing(index_elements=['region', 'start']).returning(Lease.id)
+                ).scalar_one_or_none()
+                session.commit()
+
+                # another worker has appended the same range, so the claim is retried
+                if lease_id is not None:
+                    return session.get(Lease, lease_id)
+
+    def heartbeat_lease(self, lease: Lease, cursor: int, last_founded: int) -> bool:
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker,Pydantic
+            result = session.exec(
+                update(Lease)
+                .where(Lease.id == lease.id, Lease.owner == lease.owner)
+                .values(cursor=cursor, last_founded=last_founded, heartbeat=utcnow())
+            )
+            session.commit()
+
+        return result.rowcount == 1
+
+    def release_lease(self, lease: Lease) -> bool:
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker,Pydantic
+            result = session.exec(
+                update(Lease)
+                .where(Lease.id == lease.id, Lease.owner == lease.owner)
+                .values(owner=None, heartbeat=utcnow())
+            )
+            session.commit()
+
+        return result.rowcount == 1
+
+    def complete_lease(self, lease: Lease):
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker,Pydantic
+            session.exec(
+                update(Lease)
+                .where(Lease.id == lease.id, Lease.owner == lease.owner)
+                .values(cursor=lease.end, done=True, heartbeat=utcnow())
+            )
+            session.commit()
+
+    def skip_leases(self, region: Region, until: int) -> tuple[int, int] | None:
+        # the ranges after the last one that end before that id are dead, they're appended as one done lease,
+        # so the next range appended is the one of the id; a range appended by another worker meanwhile wins
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker,Pydantic
+            start = session.exec(select(func.max(Lease.end)).where(Lease.region == region)).one()
+            end = start + (until - start) // LEASE_SIZE * LEASE_SIZE
+            if end <= start:
+                return None
+
+            statement = insert(Lease).values(
+                region=region,
+                start=start,
+                end=end,
+                cursor=end,
+                last_founded=start - 1,
+                done=True,
+                owner=None,
+                heartbeat=utcnow()
+            )
+            # noinspection PyDeprecation
+            lease_id = session.execute(
+                statement.on_conflict_do_nothing(index_elements=['region', 'start']).returning(Lease.id)
+            ).scalar_one_or_none()
+            session.commit()
+
+        return (start, end) if lease_id is not None else None
+
+    def load_checkpoint(self, region: Region) -> Checkpoint | None:
+        with Session(self.engine) as session:
+            return session.get(Checkpoint, region)
+
+    def save_checkpoint(self, region: Region, cursor: int, last_founded: int):
+        statement = insert(Checkpoint).values(region=region, cursor=cursor, last_founded=last_founded, updated=utcnow())
 
+        with Session(self.engine) as session:
+            # noinspection PyDeprecation
+            session.execute(statement.on_conflict_do_update(
+                index_elements=['region'],
+                set_={
+                    'cursor': statement.excluded.cursor,
+                    'last_founded': statement.excluded.last_founded,
+                    'updated': statement.excluded.updated
+                }
+            ))
             session.commit()
 
-        return challenges_name_to_challenge
+    def get_timelines(self, match_id: int) -> list[ParticipantTimeline]:
+        # the time series of a whole match in one read
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker,Pydantic
+            return session.exec(
+                select(ParticipantTimeline)
+                .where(ParticipantTimeline.match_id == match_id)
+                .order_by(ParticipantTimeline.participantId)
+            ).all()
+
+    def get_max_game_id(self, region: Region) -> int | None:
+        with Session(self.engine) as session:
+            # noinspection PyTypeChecker,Pydantic
+            return session.exec(select(func.max(Match.gameId)).where(Match.platformId == region)).one()
+
+    @staticmethod
+    def _collect(matches: list[Match], frames: list[Frame] | None = None) -> dict[type[SQLModel], list]:
+        # the rows of the graphs by table, read from __dict__ so no collection is loaded or created
+        rows = {model: [] for model in COPIES}
+        for match in matches:
+            rows[Match].append(match)
+            rows[Team].extend(match.__dict__.get('teams') or [])
+            rows[Participant].extend(match.__dict__.get('participants') or [])
+            rows[Frame].extend(match.__dict__.get('frames') or [])
+
+        rows[Frame].extend(frames or [])
+
+        for team in rows[Team]:
+            rows[Ban].extend(team.__dict__.get('bans') or [])
+
+        for participant in rows[Participant]:
+            rows[Perk].extend(participant.__dict__.get('perks') or [])
+            rows[ChallengeParticipantLink].extend(participant.__dict__.get('challenge_links') or [])
+            if (missions := participant.__dict__.get('missions')) is not None:
+                rows[Missions].append(missions)
+            if (timeline := participant.__dict__.get('timeline')) is not None:
+                rows[ParticipantTimeline].append(timeline)
+
+        for frame in rows[Frame]:
+            rows[Event].extend(frame.__dict__.get('events') or [])
+            rows[ParticipantFrame].extend(frame.__dict__.get('participant_frames') or [])
+
+        for event in rows[Event]:
+            rows[VictimDamageDealt].extend(event.__dict__.get('victimDamageDealt') or [])
+            rows[VictimDamageReceived].extend(event.__dict__.get('victimDamageReceived') or [])
+
+        return rows
+
+    @staticmethod
+    def _copy_events(cursor: Cursor, events: list[Event]):
+        tables: dict[type[SQLModel], list[Event]] = {}
+        for event in events:
+            tables.setdefault(get_event_table(event), []).append(event)
+
+        for model, objects in tables.items():
+            EVENT_COPIES[model].write_objects(cursor, objects)
+
+    def _copy(self, session: Session, rows: dict[type[SQLModel], list]):
+        # the graph never enters the session, every row is copied with a key assigned here
+        cursor = session.connection().connection.cursor()
+
+        for model, objects in rows.items():
+            if 'id' in model.__table__.columns:
+                self.keys.assign(cursor, model, objects)
+
+        for model, objects in rows.items():
+            if model is Event and EVENTS == 'sparse':
+                self._copy_events(cursor, objects)
+            elif model is not AssistingParticipantsLink:
+                COPIES[model].write_objects(cursor, objects)
+
+        COPIES[AssistingParticipantsLink].write_values(cursor, [
+            {'event_id': event.id, 'gameId': get_value(event, 'gameId'), 'participant_id': participant.id}
+            for event in rows.get(Event) or []
+            for participant in event.__dict__.get('assistingParticipants') or []
+        ])
+
+    def _write_match_bulk(self, session: Session, match: Match, frames: Iterable[Frame] | None = None):
+        self._copy(session, self._collect([match]))
+
+        if frames is not None:
+            for frame in frames:
+                frame.match_id = match.id
+                self._copy(session, self._collect([], [frame]))
+
+                # backrefs put the frames of participants into their collections, they aren't kept
+                for participant in match.__dict__.get('participants') or []:
+                    participant.__dict__.pop('participant_frames', None)
+
+            # the frame interval and the timelines of participants of a stream are known once its frames are over
+            session.execute(update(Match).where(Match.id == match.id).values(frameInterval=match.frameInterval))
+            self._copy(session, {ParticipantTimeline: [
+                participant.__dict__['timeline']
+                for participant in match.__dict__.get('participants') or []
+                if 'timeline' in participant.__dict__
+            ]})
+
+    @staticmethod
+    def _write_match(session: Session, match: Match, frames: Iterable[Frame] | None = None):
+        session.add(match)
+
+        # streamed frames are flushed one by one and dropped, the participants are persistent by then,
+        # so backrefs only queue the frames in their unloaded participant_frames, which is expired anyway
+        if frames is not None:
+            session.flush()
+            for frame in frames:
+                frame.match_id = match.id
+                session.add(frame)
+                session.flush()
+
+                for participant in match.participants:
+                    session.expire(participant, ['participant_frames'])
+
+    def add_matches(self, matches: list[tuple[Match, Iterable[Frame] | None]]) -> list[Exception | None]:
+        # one commit for the whole batch, every match is written in its own savepoint,
+        # so a failing one is rolled back alone and the rest of the batch is kept
+        errors = []
+        # rows are expired by the commit, their keys are read before
+        keys = [(match.platformId, match.gameId) for match, _ in matches]
+
+        # keys of the matches come first, so the partitions of their rows are created before the batch takes any lock;
+        # they're reserved per batch, a block kept for long would keep old partitions written
+        with self.engine.connect() as connection:
+            self.keys.assign(connection.connection.cursor(), Match, [match for match, _ in matches], len(matches))
+        self.create_partitions(max(match.id for match, _ in matches))
 
-    def add_match(self, match: Match):
         with Session(self.engine) as session:
-            session.add(match)
+            # without streams the graphs of the whole batch go in one copy per table, a batch that
+            # fails is written again match by match, keys already assigned are kept
+            if BULK_WRITE and len(matches) > 1 and all(frames is None for _, frames in matches):
+                try:
+                    with session.begin_nested():
+                        self._copy(session, self._collect([match for match, _ in matches]))
+
+                except Exception as err:
+                    logger.warning(f'batch of {len(matches)} matches failed, written one by one: {err}')
+
+                else:
+                    errors = [None] * len(matches)
+
+            if not errors:
+                for match, frames in matches:
+                    try:
+                        with session.begin_nested():
+                            if BULK_WRITE:
+                                self._write_match_bulk(session, match, frames)
+                            else:
+                                self._write_match(session, match, frames)
+
+                    except Exception as err:
+                        errors.append(err)
+
+                    else:
+                        errors.append(None)
+
             session.commit()
+
+        for (region, game_id), error in zip(keys, errors):
+            if error is None and region is not None and game_id is not None:
+                self._ingested(region).add(game_id)
+
+        return errors
+
+    def add_match(self, match: Match, frames: Iterable[Frame] | None = None):
+        if (error := self.add_matches([(match, frames)])[0]) is not None:
+            raise error
@@ -31,22 +31,26 @@ class Region(StrEnum):
 
 
 class Platform(StrEnum):
-    BR1 = 'BR1'
-    EUN1 = 'EUN1'
-    EUW1 = 'EUW1'
-    JP1 = 'JP1'
+    BR = 'BR1'
+    EUNE = 'EUN1'
+    EUW = 'EUW1'
+    JP = 'JP1'
     KR = 'KR'
-    LA1 = 'LA1'
-    LA2 = 'LA2'
-    NA1 = 'NA1'
-    OC1 = 'OC1'
-    TR1 = 'TR1'
+    LAN = 'LA1'
+    LAS = 'LA2'
+    NA = 'NA1'
+    OCE = 'OC1'
+    TR = 'TR1'
     RU = 'RU'
-    PH2 = 'PH2'
-    SG2 = 'SG2'
-    TH2 = 'TH2'
-    TW2 = 'TW2'
-    VN2 = 'VN2'
+    PH = 'PH2'
+    SG = 'SG2'
+    TH = 'TH2'
+    TW = 'TW2'
+    VN = 'VN2'
+
+    @property
+    def region(self) -> Region:
+        return getattr(Region, self.name)
 
     def __repr__(self) -> str:
         return repr(self.value)
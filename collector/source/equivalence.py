@@ -0,0 +1,132 @@
+import argparse
+import multiprocessing
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import config
+from config import POSTGRES_DB
+
+
+# replays archived responses with every write path into a scratch database and compares the stored
+# data with ids replaced by natural keys, run it on a sample of real responses after changing how
+# matches are written
+
+# settings of config by write path, the first one is the reference
+WRITE_PATHS: dict[str, dict[str, Any]] = {
+    'orm': {'BULK_WRITE': False, 'STREAM_TIMELINES': False, 'EVENTS': 'wide'},
+    'copy': {'BULK_WRITE': True, 'STREAM_TIMELINES': False, 'EVENTS': 'wide'},
+    'stream': {'BULK_WRITE': True, 'STREAM_TIMELINES': True, 'EVENTS': 'wide'},
+    'sparse': {'BULK_WRITE': True, 'STREAM_TIMELINES': False, 'EVENTS': 'sparse'}
+}
+
+# columns that identify a referenced row instead of its id
+NATURAL_KEYS = {
+    'match': ['platformId', 'gameId'],
+    'participant': ['match_id', 'participantId'],
+    'team': ['match_id', 'teamId'],
+    'frame': ['match_id', 'timestamp'],
+    'event': ['frame_id', 'timestamp', 'type'],
+    'challenge': ['name']
+}
+# differ between two writes of the same data
+SKIPPED = {'id', 'inserted'}
+
+
+def dump(settings: dict[str, Any], path: Path, database: str, limit: int | None) -> dict[str, Counter[str]]:
+    # modules read config once they're imported, so every write path runs in a process of its own
+    for name, value in settings.items():
+        setattr(config, name, value)
+    config.POSTGRES_DB = database
+
+    import replay
+    from db import DB, TABLES, SPARSE_EVENTS
+    from sqlalchemy import text
+
+    setup = DB(config.POSTGRES_USER, config.POSTGRES_PASSWORD, config.POSTGRES_HOST, database, pool_size=1)
+    setup.drop_tables()
+    setup.create_tables()
+    setup.engine.dispose()
+
+    replay.init(path)
+    for location in list(replay.get_locations(path))[:limit]:
+        replay.replay(*location)
+
+    # events of every mode are read through the view, in the columns of event
+    tables = [
+        table for table in TABLES
+        if table.name not in ('lease', 'checkpoint') and table not in [model.__table__ for model in SPARSE_EVENTS]
+    ]
+    with replay.db.engine.connect() as connection:
+        rows = {
+            table.name: connection.execute(
+                text(f'SELECT * FROM {'event_wide' if table.name == 'event' else table.name}')
+            ).mappings().all()
+            for table in tables
+        }
+
+    ids = {name: {row['id']: row for row in rows[name]} for name in NATURAL_KEYS}
+    # a composite foreign key is resolved by its first column, the others are part of the same reference
+    references = {
+        table.name: {
+            constraint.column_keys[0]: constraint.referred_table.name for constraint in table.foreign_key_constraints
+        }
+        for table in tables
+    }
+    skipped = {
+        table.name: SKIPPED | {key for constraint in table.foreign_key_constraints for key in constraint.column_keys[1:]}
+        for table in tables
+    }
+
+    def resolve(table: str, column: str, value: Any) -> Any:
+        if value is None or column not in references[table]:
+            return value
+
+        target = references[table][column]
+        row = ids[target][value]
+        return tuple(resolve(target, key, row[key]) for key in NATURAL_KEYS[target])
+
+    return {
+        name: Counter(
+            repr(sorted(
+                (column, resolve(name, column, value)) for column, value in row.items() if column not in skipped[name]
+            ))
+            for row in table_rows
+        )
+        for name, table_rows in rows.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the data stored by every write path on archived responses')
+    parser.add_argument('path', type=Path, help='archive directory or directory of json files')
+    parser.add_argument('--database', default=f'{POSTGRES_DB}_equivalence', help='scratch database, its tables are dropped')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.database == POSTGRES_DB:
+        raise ValueError('the tables of the database are dropped, it has to be a scratch one')
+
+    dumps = {}
+    for name, settings in WRITE_PATHS.items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            dumps[name] = executor.submit(dump, settings, args.path, args.database, args.limit).result()
+
+    reference, *others = WRITE_PATHS
+    mismatches = 0
+    for table, expected in dumps[reference].items():
+        print(f'{table}: {expected.total()} rows with {reference}')
+
+        for name in others:
+            actual = dumps[name][table]
+            missing, extra = (expected - actual).total(), (actual - expected).total()
+            mismatches += missing + extra
+            print(f'  {name:>8}: {actual.total()} rows, {missing} missing, {extra} extra')
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
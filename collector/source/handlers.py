@@ -1,18 +1,206 @@
+import json
+import threading
+import time
+from typing import Callable
+
+import msgspec
+
 from pydantic import ValidationError
-from riotwatcher import Deserializer
+from requests import Session
+from requests.adapters import HTTPAdapter
+from riotwatcher import Deserializer, RateLimiter, LolWatcher
 
+from archive import Archive
+import structs
+from config import get_logger, PARSER, STREAM_TIMELINES, HTTP_POOL_SIZE, APP_RATE_LIMIT, METHOD_RATE_LIMIT, RATE_LIMIT_MARGIN, RATE_LIMIT_BURST, RETRY_AFTER_DEFAULT
 from models import MatchDto, TimelineDto
+from timeline import TimelineStream
+
+logger = get_logger(__name__)
+
+
+# parsers of the match-v5 methods by engine
+PARSERS: dict[str, dict[str, Callable[[str | bytes], MatchDto | TimelineDto]]] = {
+    'pydantic': {
+        'by_id': MatchDto.model_validate_json,
+        'timeline_by_match': TimelineDto.model_validate_json
+    },
+    'msgspec': {
+        'by_id': structs.match_decoder.decode,
+        'timeline_by_match': structs.timeline_decoder.decode
+    }
+}
+
 
+class MatchDeserializer(Deserializer):
+    def __init__(self, archive: Archive | None = None, parser: str = PARSER, stream: bool = STREAM_TIMELINES):
+        self.archive = archive
+        self.parser = parser
+        self.parsers = PARSERS[parser]
+        self.stream = stream
 
-class PydanticDeserializer(Deserializer):
-    def deserialize(self, endpoint_name: str, method_name: str, data: str) -> MatchDto | TimelineDto:
+    def deserialize(
+            self, endpoint_name: str, method_name: str, data: str
+    ) -> MatchDto | TimelineDto | TimelineStream:
         try:
-            if endpoint_name == 'MatchApiV5' and method_name == 'by_id':
-                return MatchDto.model_validate_json(data)
-            elif endpoint_name == 'MatchApiV5' and method_name == 'timeline_by_match':
-                return TimelineDto.model_validate_json(data)
+            if endpoint_name == 'MatchApiV5' and method_name == 'timeline_by_match' and self.stream:
+                # frames are validated while they're written
+                result = TimelineStream(data, self.parser)
+            elif endpoint_name == 'MatchApiV5' and method_name in self.parsers:
+                result = self.parsers[method_name](data)
             else:
                 raise ValidationError('Wrong endpoint or method')
 
-        except ValidationError:
+        except (ValidationError, msgspec.DecodeError):
+            # a body that doesn't fit the models is archived as well, it is the one to re-process later
+            if self.archive is not None and endpoint_name == 'MatchApiV5':
+                self.archive.write(self.get_match_id(data), method_name, data)
             raise
+
+        if self.archive is not None:
+            # a stream has read only what comes before its first frame, the id is taken from the body
+            match_id = self.get_match_id(data) if isinstance(result, TimelineStream) else result.metadata.matchId
+            self.archive.write(match_id, method_name, data)
+
+        return result
+
+    @staticmethod
+    def get_match_id(data: str) -> str:
+        # the deserializer isn't given the request, so a body without an id is archived under a placeholder
+        try:
+            return json.loads(data)['metadata']['matchId']
+        except (ValueError, KeyError, TypeError):
+            return f'unknown_{time.time_ns()}'
+
+
+def parse_rate_limit(header: str | None) -> tuple[tuple[int, int], ...] | None:
+    if not header:
+        return None
+
+    # '20:1,100:120' -> ((20, 1), (100, 120))
+    return tuple(tuple(int(value) for value in pair.split(':')) for pair in header.split(','))
+
+
+class TokenBucket:
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+
+        # burst + rate * window never exceeds the allowed count, so no window
+        # of the server can see more than that regardless of its alignment
+        self.allowed = max(int(limit * RATE_LIMIT_MARGIN), 1)
+        self.burst = max(int(self.allowed * RATE_LIMIT_BURST), 1)
+        self.rate = max(self.allowed - self.burst, 1) / window
+
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return now
+
+        return now - self.tokens / self.rate
+
+    def block(self, until: float):
+        # refilling restarts when the block ends, so waiting requests are paced instead of released at once
+        self.tokens = min(self.tokens, 0)
+        self.updated = max(self.updated, until)
+
+    def sync(self, count: int):
+        # the server count also includes requests made by other processes with the same key
+        self.tokens = min(self.tokens, self.allowed - count)
+
+
+class RateLimit:
+    def __init__(self, name: str, limits: tuple[tuple[int, int], ...]):
+        self.name = name
+        self.limits = limits
+        self.buckets = [TokenBucket(limit, window) for limit, window in limits]
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        return max(self.blocked_until, *(bucket.reserve(now) for bucket in self.buckets))
+
+    def update(self, limits: tuple[tuple[int, int], ...] | None, counts: tuple[tuple[int, int], ...] | None):
+        if limits and limits != self.limits:
+            logger.info(f'{self.name} rate limit changed: {self.limits} -> {limits}')
+            self.limits = limits
+            self.buckets = [TokenBucket(limit, window) for limit, window in limits]
+
+        if counts:
+            window_to_count = {window: count for count, window in counts}
+            for bucket in self.buckets:
+                if bucket.window in window_to_count:
+                    bucket.sync(window_to_count[bucket.window])
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+        for bucket in self.buckets:
+            bucket.block(until)
+
+
+class RateLimitScheduler(RateLimiter):
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        self.app = RateLimit('app', parse_rate_limit(APP_RATE_LIMIT))
+        self.methods: dict[tuple[str, str, str], RateLimit] = {}
+
+    def _get_method(self, region: str, endpoint_name: str, method_name: str) -> RateLimit:
+        # riotwatcher has already remapped the platform to its routing value here
+        key = (region, endpoint_name, method_name)
+        if key not in self.methods:
+            self.methods[key] = RateLimit(f'{region} {endpoint_name}.{method_name}', parse_rate_limit(METHOD_RATE_LIMIT))
+
+        return self.methods[key]
+
+    def wait_until(self, region: str, endpoint_name: str, method_name: str) -> None:
+        # sleep here instead of returning the time, so a Retry-After received
+        # while waiting makes requests that already have a reservation take a new one
+        while True:
+            with self.lock:
+                method = self._get_method(region, endpoint_name, method_name)
+                ready = max(self.app.reserve(time.monotonic()), method.reserve(time.monotonic()))
+
+            time.sleep(max(ready - time.monotonic(), 0))
+
+            if max(self.app.blocked_until, method.blocked_until) <= ready:
+                return
+
+    def record_response(self, region: str, endpoint_name: str, method_name: str, status: int, headers: dict[str, str]):
+        with self.lock:
+            method = self._get_method(region, endpoint_name, method_name)
+
+            self.app.update(
+                parse_rate_limit(headers.get('X-App-Rate-Limit')),
+                parse_rate_limit(headers.get('X-App-Rate-Limit-Count'))
+            )
+            method.update(
+                parse_rate_limit(headers.get('X-Method-Rate-Limit')),
+                parse_rate_limit(headers.get('X-Method-Rate-Limit-Count'))
+            )
+
+            if status == 429:
+                retry_after = float(headers.get('Retry-After', RETRY_AFTER_DEFAULT))
+                # service limits are enforced per method, so only an application limit blocks everything
+                scope = self.app if headers.get('X-Rate-Limit-Type') == 'application' else method
+                scope.block(time.monotonic() + retry_after)
+
+                logger.warning(f'{scope.name} rate limit exceeded, retry after {retry_after} seconds')
+
+
+def configure_transport(api: LolWatcher) -> Session:
+    # noinspection PyProtectedMember
+    session: Session = api._base_api._session
+
+    # one connection per concurrent request is kept alive, and requests wait for a free one
+    # instead of opening connections that are thrown away right after
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
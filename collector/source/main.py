@@ -1,15 +1,79 @@
+import sys
+import traceback
+from threading import Event, Thread
+
+from archive import Archive
 from collector import Collector, Region
-from config import RIOT_API_KEY, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_DB
+from config import (
+    get_logger,
+    NAME,
+    RIOT_API_KEY,
+    POSTGRES_USER,
+    POSTGRES_PASSWORD,
+    POSTGRES_HOST,
+    POSTGRES_DB,
+    FETCH_WORKERS,
+    TRANSFORM_WORKERS,
+    WRITE_WORKERS,
+    ARCHIVE_PATH
+)
 from db import DB
+from handlers import RateLimitScheduler
+
+logger = get_logger(__name__)
+
+# where the lease pool of a region starts when it has no leases yet
+START_IDS = {
+    # Region.RU: 436_605_000,
+    Region.RU: 506_604_852,
+}
+
+
+def collect(collector: Collector, start_id: int, failed: list[Region]):
+    # sys.exit in a thread would only end the thread, so the error is reported to main instead
+    try:
+        collector.start_leased(start_id)
+
+    except BaseException as err:
+        logger.critical(f'collecting failed: region = {collector.region}, {err}: {traceback.format_exc()}')
+        failed.append(collector.region)
+        collector.stop.set()
 
 
 def main():
-    db = DB(POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_DB)
+    db = DB(
+        POSTGRES_USER,
+        POSTGRES_PASSWORD,
+        POSTGRES_HOST,
+        POSTGRES_DB,
+        pool_size=(FETCH_WORKERS + TRANSFORM_WORKERS + WRITE_WORKERS) * len(START_IDS)
+    )
     db.create_tables()
-    collector = Collector(db, api_key=RIOT_API_KEY, region=Region.RU)
+    db.load_challenges()
+    db.sync_ingested()
+
+    # regions have their own method limits per routing value, but share the app limit of the key
+    rate_limiter = RateLimitScheduler()
+    archive = Archive(ARCHIVE_PATH) if ARCHIVE_PATH else None
+    # a failed region stops the others, so the process exits and is restarted as a whole
+    stop = Event()
+    failed: list[Region] = []
+
+    threads = []
+    for region, start_id in START_IDS.items():
+        collector = Collector(
+            db, api_key=RIOT_API_KEY, region=region, rate_limiter=rate_limiter, archive=archive, stop=stop
+        )
+
+        thread = Thread(target=collect, args=(collector, start_id, failed), name=f'{NAME}-{region}')
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
 
-    # collector.start(436_605_000)
-    collector.start(506_604_852)
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
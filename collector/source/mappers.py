@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, UTC
+from operator import attrgetter
+from types import UnionType
+from typing import Any, Callable, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm.attributes import manager_of_class
+from sqlmodel import SQLModel
+
+import db
+import models
+
+EPOCH = datetime.fromtimestamp(0, UTC)
+
+
+def to_datetime(value: int | None) -> datetime | None:
+    # the same as pydantic does with a unix timestamp, milliseconds are told apart by the magnitude
+    if value is None:
+        return None
+
+    return EPOCH + (timedelta(milliseconds=value) if abs(value) > 2e10 else timedelta(seconds=value))
+
+
+def unwrap(annotation: Any) -> Any:
+    if get_origin(annotation) in (Union, UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return args[0] if len(args) == 1 else annotation
+
+    return annotation
+
+
+class Mapper:
+    # copies the fields of dtos into a row the way model_validate(dto.model_dump()) does, without the dict
+    # and the second validation: a field comes from the last source that has it, a before validator of
+    # the row and int timestamps to datetime are the only conversions, the dtos are already validated
+    def __init__(self, target: type[SQLModel], *sources: type[BaseModel]):
+        self.target = target
+        self.manager = manager_of_class(target)
+
+        self.defaults = {name: field.default for name, field in target.model_fields.items() if not field.is_required()}
+        self.factories = {
+            name: field.default_factory for name, field in target.model_fields.items() if field.default_factory
+        }
+
+        validators = {
+            name: decorator.func
+            for decorator in target.__pydantic_decorators__.field_validators.values()
+            if decorator.info.mode == 'before'
+            for name in decorator.info.fields
+        }
+
+        self.fields: list[list[str]] = [[] for _ in sources]
+        self.converters: dict[str, Callable[[Any], Any]] = {}
+        for name, field in target.model_fields.items():
+            key = field.alias or name
+            found = [number for number, source in enumerate(sources) if key in source.model_fields]
+            if not found:
+                continue
+
+            self.fields[found[-1]].append(name)
+            source_annotation = unwrap(sources[found[-1]].model_fields[key].annotation)
+
+            if name in validators:
+                self.converters[name] = validators[name]
+            elif unwrap(field.annotation) is datetime and source_annotation is int:
+                self.converters[name] = to_datetime
+
+        keys = [[target.model_fields[name].alias or name for name in fields] for fields in self.fields]
+        self.getters = [self._getter(source_keys) for source_keys in keys]
+
+    @staticmethod
+    def _getter(keys: list[str]) -> Callable[[Any], tuple]:
+        if not keys:
+            return lambda _: ()
+
+        # attrgetter returns a bare value for a single name
+        getter = attrgetter(*keys)
+        return getter if len(keys) > 1 else lambda source: (getter(source),)
+
+    def values(self, *sources: Any, **values: Any) -> dict[str, Any]:
+        for fields, getter, source in zip(self.fields, self.getters, sources):
+            values |= zip(fields, getter(source))
+
+        for name, converter in self.converters.items():
+            if name in values:
+                values[name] = converter(values[name])
+
+        return values
+
+    def __call__(self, *sources: Any, **values: Any) -> SQLModel:
+        values = self.values(*sources, **values)
+
+        # the row is filled the way sqlmodel_table_construct does it, but through its __dict__ instead of
+        # an instrumented setattr per field, the unit of work inserts a pending row from its __dict__ anyway
+        row = self.manager.new_instance()
+        row.__dict__.update(self.defaults)
+        row.__dict__.update({name: factory() for name, factory in self.factories.items()})
+        row.__dict__.update(values)
+        object.__setattr__(row, '__pydantic_fields_set__', set(values))
+        object.__setattr__(row, '__pydantic_extra__', None)
+
+        return row
+
+
+# instances are created without __init__, which is what configures the mappers otherwise
+configure_mappers()
+
+match = Mapper(db.Match, models.InfoDto, models.MetadataDto)
+participant = Mapper(db.Participant, models.ParticipantDto)
+missions = Mapper(db.Missions, models.MissionsDto)
+perk = Mapper(db.Perk, models.PerkStyleSelectionDto)
+team = Mapper(db.Team, models.TeamDto)
+ban = Mapper(db.Ban, models.BanDto)
+event = Mapper(db.Event, models.EventsTimeLineDto)
+victim_damage_dealt = Mapper(db.VictimDamageDealt, models.VictimDamageDealt)
+victim_damage_received = Mapper(db.VictimDamageReceived, models.VictimDamageReceived)
+participant_frame = Mapper(
+    db.ParticipantFrame, models.ParticipantFrameDto, models.ChampionStatsDto, models.DamageStatsDto, models.PositionDto
+)
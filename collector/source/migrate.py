@@ -0,0 +1,209 @@
+import argparse
+
+from sqlalchemy import Connection, ForeignKeyConstraint, inspect, text
+from sqlalchemy.schema import AddConstraint, CreateColumn, CreateIndex
+from sqlmodel import SQLModel
+
+from config import (
+    get_logger,
+    CHALLENGES,
+    PARTITION_AHEAD,
+    PARTITION_SIZE,
+    POSTGRES_USER,
+    POSTGRES_PASSWORD,
+    POSTGRES_HOST,
+    POSTGRES_DB
+)
+from db import DB, PARTITIONED, TABLES, add_partitions, compare_tables, get_constraint_key
+from enums import Platform
+
+logger = get_logger(__name__)
+
+# upgrades a database created by an older version to the schema of db.py in one transaction: the matchId
+# column, gameId as bigint, the unique key of a match, partitioned event tables, the keys of their children
+# and the challenges column; stop the collectors before running it
+
+
+def get_columns(connection: Connection, table: str) -> set[str]:
+    return {column['name'] for column in inspect(connection).get_columns(table)}
+
+
+def quote(connection: Connection, name: str) -> str:
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def drop_match_id(connection: Connection):
+    if 'matchId' not in get_columns(connection, 'match'):
+        return
+
+    # the key of a match is its platform and game, both were stored next to the matchId already
+    platforms = ' '.join(f"WHEN '{platform.value}' THEN '{platform.name}'" for platform in Platform)
+    connection.execute(text(
+        'UPDATE match SET '
+        '"gameId" = coalesce("gameId", split_part("matchId", \'_\', 2)::bigint), '
+        f'"platformId" = coalesce("platformId", (CASE split_part("matchId", \'_\', 1) {platforms} END)::region) '
+        'WHERE "matchId" IS NOT NULL'
+    ))
+    connection.execute(text('ALTER TABLE match DROP COLUMN "matchId"'))
+    logger.info('match.matchId dropped')
+
+
+def rename_plain_tables(connection: Connection) -> list[type[SQLModel]]:
+    # tables created before partitioning are moved out of the way of their partitioned versions, with
+    # their indexes and sequences, whose names are taken by the new ones
+    models = [
+        model for model in PARTITIONED
+        if connection.execute(
+            text("SELECT relkind FROM pg_class WHERE relname = :name AND relnamespace = current_schema()::regnamespace"),
+            {'name': model.__tablename__}
+        ).scalar() == 'r'
+    ]
+    for model in models:
+        name = model.__tablename__
+        sequence = connection.execute(text('SELECT pg_get_serial_sequence(:name, :column)'), {
+            'name': name, 'column': 'id'
+        }).scalar()
+        indexes = connection.execute(text(
+            'SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :name'
+        ), {'name': name}).scalars().all()
+
+        connection.execute(text(f'ALTER TABLE {name} RENAME TO {name}_old'))
+        for index in indexes:
+            connection.execute(text(f'ALTER INDEX {quote(connection, index)} RENAME TO {quote(connection, index + '_old')}'))
+        if sequence is not None:
+            connection.execute(text(f'ALTER SEQUENCE {sequence} RENAME TO {name}_id_seq_old'))
+
+    return models
+
+
+def fix_columns(connection: Connection):
+    missing, retyped, _ = compare_tables(connection)
+    for column in missing:
+        connection.execute(text(
+            f'ALTER TABLE {column.table.name} ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}'
+        ))
+        logger.info(f'{column.table.name}.{column.name} added')
+
+    for column in retyped:
+        name, type_ = quote(connection, column.name), column.type.compile(connection.dialect)
+        connection.execute(text(f'ALTER TABLE {column.table.name} ALTER COLUMN {name} TYPE {type_} USING {name}::{type_}'))
+        logger.info(f'{column.table.name}.{column.name} changed to {type_}')
+
+
+def copy_plain_tables(connection: Connection, models: list[type[SQLModel]]):
+    for model in models:
+        name = model.__tablename__
+        columns = get_columns(connection, f'{name}_old')
+        # the partition key is the match, rows of the older schema without it have it through their frame
+        key = next(column.name for column in model.__table__.primary_key.columns if column.name != 'id')
+        values = {
+            column.name: f'{name}_old.{quote(connection, column.name)}'
+            for column in model.__table__.columns
+            if column.name in columns
+        }
+        values[key] = (
+            f'coalesce({values[key]}, frame.match_id)' if key in values else 'frame.match_id'
+        )
+
+        count = connection.execute(text(
+            f'INSERT INTO {name} ({', '.join(quote(connection, column) for column in values)}) '
+            f'SELECT {', '.join(values.values())} FROM {name}_old LEFT JOIN frame ON frame.id = {name}_old.frame_id'
+        )).rowcount
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), coalesce(max(id), 0) + 1, false) FROM {name}"
+        ))
+        # the foreign keys of its children to the old table go with it, fix_keys adds the new ones
+        connection.execute(text(f'DROP TABLE {name}_old CASCADE'))
+        logger.info(f'{name} partitioned, {count} rows copied')
+
+
+def fix_keys(connection: Connection):
+    _, _, constraints = compare_tables(connection)
+    for constraint in constraints:
+        if isinstance(constraint, ForeignKeyConstraint) and len(constraint.elements) > 1:
+            # the other columns of a composite key are filled from the row referenced by the first one
+            first, *others = constraint.elements
+            table, referred = constraint.table.name, constraint.referred_table.name
+            connection.execute(text(
+                f'UPDATE {table} SET ' + ', '.join(
+                    f'{quote(connection, element.parent.name)} = {referred}.{quote(connection, element.column.name)}'
+                    for element in others
+                ) +
+                f' FROM {referred} WHERE {referred}.{quote(connection, first.column.name)} = '
+                f'{table}.{quote(connection, first.parent.name)}'
+            ))
+
+        connection.execute(AddConstraint(constraint))
+        logger.info(f'{constraint.table.name}: {get_constraint_key(constraint)[0]} of '
+                    f'{', '.join(column.name for column in constraint.columns)} added')
+
+
+def fix_defaults_and_indexes(connection: Connection):
+    for table in TABLES:
+        for column in table.columns:
+            if column.server_default is not None:
+                default = column.server_default.arg.compile(dialect=connection.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ALTER COLUMN {quote(connection, column.name)} SET DEFAULT {default}'
+                ))
+
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def fill_challenges(connection: Connection):
+    # values of rows are strings, str of the value in older versions and its repr in newer ones
+    count = connection.execute(text(r"""
+        UPDATE participant SET challenges = links.challenges FROM (
+            SELECT participant_id, jsonb_object_agg(challenge.name, CASE
+                WHEN value ~ '^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$' OR value ~ '^\[[-0-9., eE+]*\]$'
+                    THEN value::jsonb
+                WHEN value = 'True' THEN 'true'::jsonb
+                WHEN value = 'False' THEN 'false'::jsonb
+                WHEN value = 'None' THEN 'null'::jsonb
+                WHEN value ~ '^''.*''$' THEN to_jsonb(substr(value, 2, length(value) - 2))
+                ELSE to_jsonb(value)
+            END) AS challenges
+            FROM challengeparticipantlink JOIN challenge ON challenge.id = challengeparticipantlink.challenge_id
+            GROUP BY participant_id
+        ) AS links
+        WHERE participant.id = links.participant_id AND participant.challenges IS NULL
+    """)).rowcount
+    # the rows are kept, nothing reads them in jsonb mode and they're still there when going back to rows
+    logger.info(f'challenges of {count} participants moved to participant.challenges')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upgrade a database of an older version to the current schema')
+    parser.add_argument('--check', action='store_true', help='only report the differences')
+    args = parser.parse_args()
+
+    db = DB(POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_DB, pool_size=1)
+    if args.check:
+        db.check_tables()
+        logger.info('the database has the current schema')
+        return
+
+    with db.engine.begin() as connection:
+        drop_match_id(connection)
+        models = rename_plain_tables(connection)
+        # the tables of the current schema that don't exist yet, partitioned ones among them
+        SQLModel.metadata.create_all(connection, tables=TABLES)
+        first, last = connection.execute(text('SELECT min(id), max(id) FROM match')).one()
+        if first is not None:
+            add_partitions(connection, first // PARTITION_SIZE, last // PARTITION_SIZE + PARTITION_AHEAD)
+
+        fix_columns(connection)
+        copy_plain_tables(connection, models)
+        fix_keys(connection)
+        fix_defaults_and_indexes(connection)
+        if CHALLENGES == 'jsonb':
+            fill_challenges(connection)
+
+    # the views and the partitions ahead, check_tables fails if anything is left
+    db.create_tables()
+    logger.info('the database is upgraded')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,8 @@
-from typing import List
+from typing import Any, List
 
-from pydantic import BaseModel, Field, field_validator, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict
 
-from enums import GameMode, GameType, Lane, Role, Tower, Region
+from enums import GameMode, GameType, Lane, Role, Tower, Platform
 
 
 # Match models
@@ -106,7 +106,7 @@ class ParticipantDto(BaseModel):
     championTransform: int | None = Field(None,
                                           description='This field is currently only utilized for Kayn\'s transformations. (Legal values: 0 - None, 1 - Slayer, 2 - Assassin)')
     consumablesPurchased: int | None = None
-    challenges: dict[str, str] | None = None  # ChallengesDto
+    challenges: dict[str, Any] | None = None  # ChallengesDto
     damageDealtToBuildings: int | None = None
     damageDealtToObjectives: int | None = None
     damageDealtToTurrets: int | None = None
@@ -243,15 +243,6 @@ class ParticipantDto(BaseModel):
     wardsKilled: int | None = None
     wardsPlaced: int | None = None
     win: bool | None = None
-
-    # noinspection PyNestedDecorators
-    @field_validator('challenges', mode='before')
-    def convert_values_to_str(cls, obj: dict | None) -> dict[str, str] | None:
-        if obj is None:
-            return None
-
-        return {key: repr(val) for key, val in obj.items()}
-
     basicPings: int | None = None
     dangerPings: int | None = None
     retreatPings: int | None = None
@@ -277,7 +268,7 @@ class InfoDto(BaseModel):
                                     description='The first two parts can be used to determine the patch a game was played on.')
     mapId: int | None = Field(None, description='Refer to the Game Constants documentation.')
     participants: List[ParticipantDto] | None = None
-    platformId: Region | None = Field(None, description='Platform where the match was played.')
+    platformId: Platform | None = Field(None, description='Platform where the match was played.')
     queueId: int | None = Field(None, description='Refer to the Game Constants documentation.')
     teams: List[TeamDto] | None = None
     tournamentCode: str | None = Field(None,
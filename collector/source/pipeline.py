@@ -0,0 +1,118 @@
+import time
+import traceback
+from queue import Empty, Queue
+from threading import Thread
+from typing import Any, Callable
+
+
+class Job:
+    def __init__(self, index: int):
+        self.index = index
+        self.found = False
+        self.data: Any = None
+
+        self.error: Exception | None = None
+        self.traceback: str | None = None
+        # set when the job has to be run again from the first stage
+        self.retry: Exception | None = None
+
+
+class Pipeline:
+    # every stage takes a job and returns whether it goes on to the next stage, a batched stage
+    # (stage, workers, size, latency) takes up to size jobs gathered for at most latency seconds
+    # and returns that for each of them; finished jobs come out of done in completion order
+    def __init__(self, name: str, stages: list[tuple], queue_size: int):
+        self.queues: list[Queue[Job | None]] = [Queue(maxsize=queue_size) for _ in stages]
+        self.done: Queue[Job] = Queue()
+        self.stopped = False
+
+        self.threads: list[list[Thread]] = []
+        for number, (stage, workers, *batch) in enumerate(stages):
+            target, args = (self._work_batch, (stage, number, *batch)) if batch else (self._work, (stage, number))
+            threads = [
+                Thread(target=target, args=args, name=f'{name}-{stage.__name__}-{worker}', daemon=True)
+                for worker in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+
+            self.threads.append(threads)
+
+    def _work(self, stage: Callable[[Job], bool], number: int):
+        source = self.queues[number]
+        target = self.queues[number + 1] if number + 1 < len(self.queues) else None
+
+        while (job := source.get()) is not None:
+            if self.stopped:
+                continue
+
+            try:
+                proceed = stage(job)
+            except Exception as err:
+                job.error = err
+                job.traceback = traceback.format_exc()
+                proceed = False
+
+            self._forward(job, proceed, target)
+
+    def _work_batch(self, stage: Callable[[list[Job]], list[bool]], number: int, size: int, latency: float):
+        source = self.queues[number]
+        target = self.queues[number + 1] if number + 1 < len(self.queues) else None
+
+        running = True
+        while running and (job := source.get()) is not None:
+            batch = [job]
+            deadline = time.monotonic() + latency
+            while len(batch) < size and (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    job = source.get(timeout=timeout)
+                except Empty:
+                    break
+
+                # the gathered jobs are still processed before the worker stops
+                if job is None:
+                    running = False
+                    break
+
+                batch.append(job)
+
+            if self.stopped:
+                continue
+
+            try:
+                proceeds = stage(batch)
+            except Exception as err:
+                for job in batch:
+                    job.error = err
+                    job.traceback = traceback.format_exc()
+                proceeds = [False] * len(batch)
+
+            for job, proceed in zip(batch, proceeds):
+                self._forward(job, proceed, target)
+
+    def _forward(self, job: Job, proceed: bool, target: Queue[Job | None] | None):
+        if proceed and target is not None:
+            target.put(job)
+        else:
+            job.data = None
+            self.done.put(job)
+
+    def put(self, job: Job):
+        self.queues[0].put(job)
+
+    def full(self) -> bool:
+        return self.queues[0].full()
+
+    def get(self) -> Job:
+        return self.done.get()
+
+    def stop(self):
+        self.stopped = True
+
+        # a stage is stopped only after the previous one, so no job is put behind the sentinels
+        for queue, threads in zip(self.queues, self.threads):
+            for _ in threads:
+                queue.put(None)
+
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+from archive import ArchiveReader
+from collector import Collector
+from config import (
+    get_logger,
+    KEEP_FILTERED_MATCHES,
+    RIOT_API_KEY,
+    POSTGRES_USER,
+    POSTGRES_PASSWORD,
+    POSTGRES_HOST,
+    POSTGRES_DB
+)
+from db import DB
+from enums import Platform, Region
+from handlers import MatchDeserializer
+from pipeline import Job
+
+logger = get_logger(__name__)
+
+# a location is a plain json file when offset and size are None, otherwise a frame in an archive segment
+Location = tuple[Path, int | None, int | None]
+
+db: DB | None = None
+collectors: dict[Region, Collector] = {}
+reader: ArchiveReader | None = None
+deserializer = MatchDeserializer()
+
+
+def get_locations(path: Path) -> Iterator[tuple[str, Location, Location | None]]:
+    if any(path.glob('*.idx')):
+        lookup = ArchiveReader(path).lookup()
+    else:
+        # <matchId>.by_id.json and <matchId>.timeline_by_match.json, the same kinds as in the archive
+        lookup = {
+            tuple(file.name.removesuffix('.json').rsplit('.', 1)): (file, None, None)
+            for file in path.rglob('*.json')
+        }
+
+    for (match_id, kind), location in lookup.items():
+        # filtered matches are archived without timeline
+        if kind == 'by_id':
+            yield match_id, location, lookup.get((match_id, 'timeline_by_match'))
+
+
+def read(location: Location) -> str:
+    path, offset, size = location
+    if offset is None:
+        return path.read_text(encoding='utf-8')
+
+    return reader.read(path, offset, size)
+
+
+def init(path: Path):
+    global db, reader
+
+    # every process has its own engine, connections can't be shared across a fork
+    db = DB(POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_DB, pool_size=1)
+    db.load_challenges()
+    db.sync_ingested()
+    reader = ArchiveReader(path)
+
+
+def replay(match_id: str, match_location: Location, timeline_location: Location | None) -> bool:
+    try:
+        region = Platform(match_id.split('_')[0]).region
+        if db.is_match_ingested(region, int(match_id.split('_')[1])):
+            return False
+
+        if region not in collectors:
+            # the api is never called, the collector is only used for the transform
+            collectors[region] = Collector(db, api_key=RIOT_API_KEY, region=region)
+
+        match = deserializer.deserialize('MatchApiV5', 'by_id', read(match_location))
+        if timeline_location is None:
+            # a wanted match without timeline is one whose timeline request failed
+            if not KEEP_FILTERED_MATCHES or Collector.is_wanted(match):
+                return False
+
+            timeline = None
+        else:
+            timeline = deserializer.deserialize('MatchApiV5', 'timeline_by_match', read(timeline_location))
+
+        # the same stages as collecting, without fetch
+        job = Job(int(match_id.split('_')[1]))
+        job.data = match, timeline
+        if collectors[region].transform(job):
+            collectors[region].write(job)
+
+        return True
+
+    except Exception as err:
+        logger.error(f'unexpected error while replaying {match_id} {err}: {traceback.format_exc()}')
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the database from archived raw responses')
+    parser.add_argument('path', type=Path, help='archive directory or directory of json files')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    setup = DB(POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_DB, pool_size=1)
+    setup.create_tables()
+    setup.engine.dispose()
+
+    locations = list(get_locations(args.path))[:args.limit]
+    logger.info(f'replay started: {len(locations)} matches with {args.processes} processes')
+
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=init, initargs=(args.path,)) as executor:
+        inserted = sum(executor.map(replay, *zip(*locations), chunksize=16)) if locations else 0
+
+    elapsed = time.monotonic() - started
+    logger.info(f'replay finished: {inserted} of {len(locations)} matches inserted in {elapsed:.1f} s, '
+                f'{inserted / elapsed:.2f} matches/s')
+
+
+if __name__ == '__main__':
+    main()
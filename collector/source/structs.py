@@ -0,0 +1,65 @@
+import operator
+from functools import reduce
+from types import UnionType
+from typing import Any, Union, get_args, get_origin
+
+import msgspec
+from pydantic import BaseModel
+
+import models
+
+
+# msgspec structs are generated from the pydantic models, so models.py stays the only definition;
+# decoding validates the same types and unknown fields
+
+class Struct(msgspec.Struct, kw_only=True, forbid_unknown_fields=True):
+    def model_dump(self) -> dict[str, Any]:
+        return {name: dump(getattr(self, name)) for name in self.__struct_fields__}
+
+
+def dump(value: Any) -> Any:
+    if isinstance(value, Struct):
+        return value.model_dump()
+    if isinstance(value, list):
+        return [dump(item) for item in value]
+    if isinstance(value, dict):
+        return {key: dump(item) for key, item in value.items()}
+
+    return value
+
+
+structs: dict[type[BaseModel], type[Struct]] = {}
+
+
+def convert(annotation: Any) -> Any:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return struct(annotation)
+
+    origin = get_origin(annotation)
+    if origin in (Union, UnionType):
+        return reduce(operator.or_, [convert(arg) for arg in get_args(annotation)])
+    if origin in (list, dict):
+        return origin[tuple(convert(arg) for arg in get_args(annotation))]
+
+    return annotation
+
+
+def struct(model: type[BaseModel]) -> type[Struct]:
+    if model in structs:
+        return structs[model]
+
+    fields = [
+        (name, convert(field.annotation)) if field.is_required() else (name, convert(field.annotation), field.default)
+        for name, field in model.model_fields.items()
+    ]
+
+    structs[model] = msgspec.defstruct(model.__name__, fields, bases=(Struct,), module=__name__)
+    return structs[model]
+
+
+MatchDto = struct(models.MatchDto)
+TimelineDto = struct(models.TimelineDto)
+
+# strict=False accepts the same lax inputs as pydantic, like 1.0 for an int
+match_decoder = msgspec.json.Decoder(MatchDto, strict=False)
+timeline_decoder = msgspec.json.Decoder(TimelineDto, strict=False)
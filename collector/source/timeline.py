@@ -0,0 +1,103 @@
+import json
+import re
+from typing import Any, Callable, Generator, Iterator
+
+import msgspec
+
+import models
+import structs
+from config import PARSER
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+decoder = json.JSONDecoder()
+
+# converters of already decoded json by engine
+CONVERTERS: dict[str, Callable[[Any, type], Any]] = {
+    'pydantic': lambda obj, model: model.model_validate(obj),
+    'msgspec': lambda obj, model: msgspec.convert(obj, structs.struct(model), strict=False)
+}
+
+
+class TimelineStream:
+    # info.frames is decoded and validated one frame at a time while it's consumed, everything
+    # else of the timeline is kept as decoded json and validated once the frames are over,
+    # so only the text and a single frame are in memory whatever the length of the game
+    def __init__(self, data: str, parser: str = PARSER):
+        self.data = data
+        self.convert = CONVERTERS[parser]
+
+        self.document: dict[str, Any] = {}
+        self.timeline: models.TimelineDto | None = None
+
+        # the keys are sorted in responses, so metadata is read before the first frame; a body in another
+        # order is decoded whole instead, and its frames are still validated one at a time
+        self._walk = self._object(self._skip(0), self.document, ())
+        self._first = next(self._walk, None)
+        if self._first is not None and 'metadata' not in self.document:
+            self.document = json.loads(data)
+            frames = self.document.get('info', {}).pop('frames', [])
+            self._walk = (self.convert(frame, models.FramesTimeLineDto) for frame in frames)
+            self._first = next(self._walk, None)
+
+        metadata = self.document.get('metadata')
+        self.metadata = None if metadata is None else self.convert(metadata, models.MetadataTimeLineDto)
+
+    @property
+    def info(self) -> models.InfoTimeLineDto:
+        # only valid after the frames are consumed
+        return self.timeline.info
+
+    def frames(self) -> Iterator[models.FramesTimeLineDto]:
+        if self._first is not None:
+            yield self._first
+            self._first = None
+            yield from self._walk
+
+        self.timeline = self.convert(self.document, models.TimelineDto)
+
+    def _skip(self, index: int) -> int:
+        return WHITESPACE.match(self.data, index).end()
+
+    def _expect(self, index: int, char: str) -> int:
+        if self.data[index] != char:
+            raise ValueError(f'{char!r} expected at {index} of timeline')
+
+        return self._skip(index + 1)
+
+    def _object(self, index: int, target: dict, path: tuple[str, ...]) -> Generator[Any, None, int]:
+        index = self._expect(index, '{')
+        if self.data[index] == '}':
+            return index + 1
+
+        while True:
+            key, index = decoder.raw_decode(self.data, index)
+            index = self._expect(self._skip(index), ':')
+
+            if path + (key,) == ('info',):
+                target[key] = {}
+                index = yield from self._object(index, target[key], ('info',))
+            elif path + (key,) == ('info', 'frames'):
+                index = yield from self._frames(index)
+            else:
+                target[key], index = decoder.raw_decode(self.data, index)
+
+            index = self._skip(index)
+            if self.data[index] == '}':
+                return index + 1
+
+            index = self._expect(index, ',')
+
+    def _frames(self, index: int) -> Generator[Any, None, int]:
+        index = self._expect(index, '[')
+        if self.data[index] == ']':
+            return index + 1
+
+        while True:
+            frame, index = decoder.raw_decode(self.data, index)
+            yield self.convert(frame, models.FramesTimeLineDto)
+
+            index = self._skip(index)
+            if self.data[index] == ']':
+                return index + 1
+
+            index = self._expect(index, ',')
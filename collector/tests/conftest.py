@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# the modules import each other by name and config finds the debug secrets relative to the working
+# directory, so the tests run from source the same as the collector does
+SOURCE = Path(__file__).resolve().parent.parent / 'source'
+sys.path.insert(0, str(SOURCE))
+os.chdir(SOURCE)
@@ -0,0 +1,49 @@
+import threading
+
+from bitmap import Bitmap, CHUNK_BITS
+
+
+def test_add_and_contains():
+    bitmap = Bitmap()
+    bitmap.update([0, 7, 8, 1_000_000])
+
+    assert all(value in bitmap for value in (0, 7, 8, 1_000_000))
+    assert not any(value in bitmap for value in (1, 6, 9, 999_999, 1_000_001))
+
+
+def test_duplicates_are_counted_once():
+    bitmap = Bitmap()
+    bitmap.update([5, 5, 5, 6])
+
+    assert len(bitmap) == 2
+
+
+def test_chunks_are_allocated_by_range():
+    bitmap = Bitmap()
+    assert bitmap.nbytes == 0
+    assert CHUNK_BITS * 3 not in bitmap
+
+    bitmap.update([1, CHUNK_BITS - 1])
+    assert bitmap.nbytes == CHUNK_BITS >> 3
+
+    # ids of a platform are far from zero, only their chunk is allocated
+    bitmap.add(7_000_000_000)
+    assert len(bitmap.chunks) == 2
+    assert 7_000_000_000 in bitmap and 7_000_000_001 not in bitmap
+    assert CHUNK_BITS not in bitmap
+
+
+def test_concurrent_adds_of_one_byte():
+    bitmap = Bitmap()
+    # every thread sets its own bits of the same bytes, none of them may be lost
+    threads = [
+        threading.Thread(target=bitmap.update, args=(range(offset, 80_000, 8),))
+        for offset in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(bitmap) == 80_000
+    assert all(value in bitmap for value in range(80_000))
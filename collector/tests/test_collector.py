@@ -0,0 +1,70 @@
+from typing import Callable
+
+import pytest
+
+from collector import Collector, CollectorExit
+from config import PROBE_BUDGET, PROBE_WIDTH
+from enums import Region
+
+
+class IngestedNothing:
+    @staticmethod
+    def is_match_ingested(region: Region, game_id: int) -> bool:
+        return False
+
+
+def make_collector(exists: Callable[[int], bool]) -> tuple[Collector, list[int]]:
+    collector = Collector(IngestedNothing(), api_key='key', region=Region.RU)
+    calls = []
+
+    # by_id answers for the ids that exist, nothing is requested from the api
+    def get(method, **params) -> str | None:
+        index = int(params['match_id'].split('_')[1])
+        calls.append(index)
+        return f'match {index}' if exists(index) else None
+
+    collector.get = get
+    return collector, calls
+
+
+def test_gap_is_skipped_to_the_first_existing_id():
+    collector, calls = make_collector(lambda index: index < 100 or index >= 5_000)
+
+    assert collector.probe_gap(100) == 5_000
+    assert len(calls) <= PROBE_BUDGET * PROBE_WIDTH
+
+
+def test_single_missing_id_isnt_a_gap():
+    collector, calls = make_collector(lambda index: index != 100)
+
+    assert collector.probe_gap(100) == 101
+    assert set(calls) == {100, 101}
+
+
+def test_probed_match_is_handed_over():
+    collector, _ = make_collector(lambda index: index >= 5_000)
+
+    found = collector.probe_gap(100)
+    assert collector.probed[found] == f'match {found}'
+
+
+def test_exhausted_budget_stops_the_region():
+    collector, calls = make_collector(lambda index: index < 100)
+
+    with pytest.raises(CollectorExit):
+        collector.probe_gap(100)
+
+    assert len(calls) == PROBE_BUDGET * PROBE_WIDTH
+
+
+def test_dead_stretch_past_a_leased_range():
+    # wider than the range and the ones after it, the first existing id past them is found all the same
+    collector, _ = make_collector(lambda index: index < 150 or index >= 3_000)
+
+    assert collector.probe_gap(150, 200) == 3_000
+
+
+def test_live_frontier_in_a_leased_range():
+    collector, _ = make_collector(lambda index: index < 150)
+
+    assert collector.probe_gap(150, 200) is None
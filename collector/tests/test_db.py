@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, update
+
+from config import LEASE_SIZE, LEASE_TTL, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_DB
+from db import DB, Lease, utcnow
+from enums import Region
+
+# a database of its own next to the configured one, created and dropped by the tests
+DATABASE = f'{POSTGRES_DB}_test'
+
+
+@pytest.fixture(scope='module')
+def db():
+    server = create_engine(
+        f'postgresql+psycopg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}/{POSTGRES_DB}',
+        isolation_level='AUTOCOMMIT'
+    )
+    try:
+        with server.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {DATABASE}'))
+            connection.execute(text(f"CREATE DATABASE {DATABASE} ENCODING 'UTF8' TEMPLATE template0"))
+    except OperationalError as err:
+        pytest.skip(f'postgres isn\'t available: {err}')
+
+    db = DB(POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, DATABASE, pool_size=1)
+    db.create_tables()
+    yield db
+
+    db.engine.dispose()
+    with server.connect() as connection:
+        connection.execute(text(f'DROP DATABASE {DATABASE}'))
+    server.dispose()
+
+
+def test_lease_cycle(db):
+    origin = 1_000_000
+
+    first = db.claim_lease(Region.EUW, origin, 'a')
+    assert (first.start, first.end, first.cursor, first.owner) == (origin, origin + LEASE_SIZE, origin, 'a')
+
+    # the pool is empty for another worker, so it appends the next range
+    second = db.claim_lease(Region.EUW, origin, 'b')
+    assert (second.start, second.owner) == (origin + LEASE_SIZE, 'b')
+
+    assert db.heartbeat_lease(first, origin + 10, origin + 8)
+    assert db.release_lease(first)
+
+    # a released range is taken over from its cursor
+    third = db.claim_lease(Region.EUW, origin, 'c')
+    assert (third.id, third.cursor, third.last_founded, third.owner) == (first.id, origin + 10, origin + 8, 'c')
+
+    # the former owner has lost it
+    assert not db.heartbeat_lease(first, origin + 20, origin + 20)
+    assert not db.release_lease(first)
+
+    db.complete_lease(third)
+    fourth = db.claim_lease(Region.EUW, origin, 'a')
+    assert fourth.start == origin + 2 * LEASE_SIZE
+
+    # the range of a worker that stopped heart-beating is claimed by another one
+    with Session(db.engine) as session:
+        session.exec(
+            update(Lease).where(Lease.id == second.id).values(heartbeat=utcnow() - timedelta(seconds=LEASE_TTL + 1))
+        )
+        session.commit()
+
+    fifth = db.claim_lease(Region.EUW, origin, 'd')
+    assert (fifth.id, fifth.owner) == (second.id, 'd')
+    assert not db.heartbeat_lease(second, origin + LEASE_SIZE, origin + LEASE_SIZE)
+
+
+def test_dead_ranges_are_skipped(db):
+    origin = 5_000_000
+    lease = db.claim_lease(Region.KR, origin, 'a')
+    db.complete_lease(lease)
+
+    # the ranges before the one of the found id are appended as done
+    assert db.skip_leases(Region.KR, origin + 3 * LEASE_SIZE + 5) == (origin + LEASE_SIZE, origin + 3 * LEASE_SIZE)
+    assert db.skip_leases(Region.KR, origin + 3 * LEASE_SIZE + 5) is None
+
+    lease = db.claim_lease(Region.KR, origin, 'a')
+    assert (lease.start, lease.end) == (origin + 3 * LEASE_SIZE, origin + 4 * LEASE_SIZE)
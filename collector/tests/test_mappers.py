@@ -0,0 +1,102 @@
+from functools import reduce
+from operator import or_
+
+import pytest
+from pydantic import BaseModel
+
+import mappers
+import models
+from enums import Region
+
+INFO = models.InfoDto.model_validate({
+    'endOfGameResult': 'GameComplete',
+    'gameCreation': 1_700_000_000_000,
+    'gameDuration': 1_800,
+    'gameEndTimestamp': 1_700_001_800_000,
+    'gameId': 7_000_000_001,
+    'gameMode': 'CLASSIC',
+    'gameStartTimestamp': 1_700_000_000_500,
+    'gameType': 'MATCHED_GAME',
+    'gameVersion': '14.20.1',
+    'mapId': 11,
+    'platformId': 'EUW1',
+    'queueId': 420
+})
+METADATA = models.MetadataDto.model_validate({
+    'dataVersion': '2', 'matchId': 'EUW1_7000000001', 'participants': ['puuid']
+})
+PARTICIPANT = models.ParticipantDto.model_validate({
+    'assists': 4,
+    'championId': 103,
+    'championName': 'Ahri',
+    'deaths': 3,
+    'individualPosition': 'MIDDLE',
+    'kills': 7,
+    'lane': 'MIDDLE',
+    'participantId': 1,
+    'puuid': 'puuid',
+    'role': 'SOLO',
+    'teamId': 100,
+    'teamPosition': 'MIDDLE',
+    'win': True
+})
+TEAM = models.TeamDto.model_validate({'teamId': 100, 'win': True})
+BAN = models.BanDto.model_validate({'championId': 1, 'pickTurn': 1})
+PERK = models.PerkStyleSelectionDto.model_validate({'perk': 8005, 'var1': 1, 'var2': 2, 'var3': 3})
+MISSIONS = models.MissionsDto.model_validate({'playerScore0': 1, 'playerScore1': 2})
+EVENT = models.EventsTimeLineDto.model_validate({
+    'bounty': 300,
+    'killerId': 1,
+    'realTimestamp': 1_700_000_060_000,
+    'timestamp': 60_000,
+    'type': 'CHAMPION_KILL',
+    'victimId': 6
+})
+VICTIM_DAMAGE = {
+    'basic': False, 'magicDamage': 10, 'name': 'Ahri', 'participantId': 1, 'physicalDamage': 0,
+    'spellName': 'AhriQ', 'spellSlot': 0, 'trueDamage': 0, 'type': 'OTHER'
+}
+PARTICIPANT_FRAME = models.ParticipantFrameDto.model_validate({
+    'championStats': {'abilityPower': 10, 'armor': 30, 'health': 500, 'healthMax': 600},
+    'currentGold': 500,
+    'damageStats': {'magicDamageDone': 100, 'totalDamageDone': 200},
+    'level': 5,
+    'participantId': 1,
+    'position': {'x': 100, 'y': 200},
+    'xp': 1_000
+})
+
+CASES = [
+    (mappers.match, (INFO, METADATA)),
+    (mappers.participant, (PARTICIPANT,)),
+    (mappers.team, (TEAM,)),
+    (mappers.ban, (BAN,)),
+    (mappers.perk, (PERK,)),
+    (mappers.missions, (MISSIONS,)),
+    (mappers.event, (EVENT,)),
+    (mappers.victim_damage_dealt, (models.VictimDamageDealt.model_validate(VICTIM_DAMAGE),)),
+    (mappers.victim_damage_received, (models.VictimDamageReceived.model_validate(VICTIM_DAMAGE),)),
+    (
+        mappers.participant_frame,
+        (PARTICIPANT_FRAME, PARTICIPANT_FRAME.championStats, PARTICIPANT_FRAME.damageStats, PARTICIPANT_FRAME.position)
+    )
+]
+
+
+@pytest.mark.parametrize('mapper, sources', CASES, ids=[mapper.target.__name__ for mapper, _ in CASES])
+def test_mapper_matches_model_validate(mapper: mappers.Mapper, sources: tuple[BaseModel, ...]):
+    # the rows the collector built before the mappers, a field comes from the last source that has it
+    expected = mapper.target.model_validate(reduce(or_, (source.model_dump() for source in sources)))
+    row = mapper(*sources)
+
+    assert row.model_dump(exclude={'updated'}) == expected.model_dump(exclude={'updated'})
+    assert type(row) is mapper.target
+
+
+def test_values_are_converted_and_added():
+    row = mappers.match(INFO, METADATA, frameInterval=60_000)
+
+    assert row.platformId is Region.EUW
+    assert row.gameCreation.timestamp() == 1_700_000_000
+    assert row.frameInterval == 60_000
+    assert row.matchId == 'EUW1_7000000001'
@@ -0,0 +1,62 @@
+from bisect import bisect_left
+
+import pytest
+
+from handlers import RateLimit, TokenBucket, parse_rate_limit
+
+
+def make_bucket(limit: int, window: int) -> TokenBucket:
+    bucket = TokenBucket(limit, window)
+    # reservations are made at given times instead of the clock
+    bucket.updated = 0.0
+    return bucket
+
+
+def test_parse_rate_limit():
+    assert parse_rate_limit('20:1,100:120') == ((20, 1), (100, 120))
+    assert parse_rate_limit('2000:10') == ((2000, 10),)
+    assert parse_rate_limit('') is None
+    assert parse_rate_limit(None) is None
+
+
+def test_burst_then_rate():
+    bucket = make_bucket(100, 10)
+    times = [bucket.reserve(0.0) for _ in range(bucket.burst + 2)]
+
+    assert times[:bucket.burst] == [0.0] * bucket.burst
+    assert times[bucket.burst] == pytest.approx(1 / bucket.rate)
+    assert times[bucket.burst + 1] == pytest.approx(2 / bucket.rate)
+
+
+@pytest.mark.parametrize('limit, window', [(20, 1), (100, 120), (2000, 10), (1, 1)])
+def test_no_window_exceeds_the_allowed_count(limit, window):
+    bucket = make_bucket(limit, window)
+    # requests queued at once and others arriving later, each one goes at its reserved time
+    times = sorted([bucket.reserve(0.0) for _ in range(3 * limit)] + [bucket.reserve(window * 2.5)])
+
+    for number, start in enumerate(times):
+        assert bisect_left(times, start + window - 1e-9) - number <= bucket.allowed
+
+
+def test_block_and_sync():
+    bucket = make_bucket(100, 10)
+    bucket.block(5.0)
+    # refilling starts at the end of the block, so the first request after it takes what's left
+    assert bucket.reserve(1.0) >= 5.0
+
+    bucket = make_bucket(100, 10)
+    bucket.sync(bucket.allowed)
+    assert bucket.reserve(0.0) > 0.0
+
+
+def test_rate_limit_follows_the_headers():
+    rate_limit = RateLimit('app', ((20, 1), (100, 120)))
+    rate_limit.update(((50, 1), (100, 120)), ((50, 1), (10, 120)))
+
+    assert rate_limit.limits == ((50, 1), (100, 120))
+    assert [bucket.limit for bucket in rate_limit.buckets] == [50, 100]
+    # the first second is used up by other processes of the same key
+    assert rate_limit.buckets[0].tokens <= 0
+
+    rate_limit.block(10.0)
+    assert rate_limit.reserve(0.0) >= 10.0